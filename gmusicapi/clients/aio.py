@@ -0,0 +1,296 @@
+"""asyncio versions of client methods, for making many calls at once.
+
+These wrap a logged-in client and send its protocol calls with
+`aiohttp <https://docs.aiohttp.org>`__, which must be installed separately.
+"""
+
+import asyncio
+from urllib.parse import unquote
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from gmusicapi.clients.mobileclient import Mobileclient
+from gmusicapi.exceptions import NotLoggedIn, NotSubscribed
+from gmusicapi.protocol import mobileclient, musicmanager
+from gmusicapi.protocol.shared import authtypes
+from gmusicapi.utils import utils
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+_unset = object()
+
+
+def _aiohttp_params(params):
+    """Return requests params as a list of string pairs, encoded like requests would."""
+
+    pairs = []
+    for key, val in (params or {}).items():
+        vals = val if isinstance(val, (list, tuple)) else [val]
+        pairs.extend((key, str(v)) for v in vals if v is not None)
+
+    return pairs
+
+
+def _aiohttp_timeout(timeout):
+    if timeout is None:
+        return aiohttp.ClientTimeout(total=None)
+
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+    else:
+        connect = read = timeout
+
+    return aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read)
+
+
+class _AsyncBase:
+    """Factors out sending calls for a logged-in client with aiohttp."""
+
+    def __init__(self, client, limit=100, timeout=_unset):
+        """
+        :param client: a logged-in client to send calls for.
+          Its auth, validation, logging and ``response_cache`` settings are used.
+        :param limit: the number of connections to keep open at once.
+          Calls past this wait for a connection.
+        :param timeout: like the ``timeout`` of the client.
+          Defaults to the client's.
+
+        Close this with :func:`close` when finished,
+        or use it as an async context manager.
+        """
+
+        if aiohttp is None:
+            raise ImportError("aiohttp must be installed to use %s" % type(self).__name__)
+
+        self.client = client
+
+        if timeout is _unset:
+            timeout = client.session.timeout
+        self.timeout = timeout
+
+        # auth is sent with every request; cookies could only leak between accounts
+        self._aiosession = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=limit),
+            cookie_jar=aiohttp.DummyCookieJar(),
+        )
+
+    async def close(self):
+        await self._aiosession.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _make_call(self, protocol, *args, **kwargs):
+        """Returns the response of a protocol.Call.
+
+        args/kwargs are passed to protocol.perform_async.
+
+        CallFailure may be raised."""
+
+        client = self.client
+
+        with utils.client_logging(client.logger, client.log_budget):
+            cache = client.response_cache
+            if cache is None or protocol.cache_ttl is None:
+                return await protocol.perform_async(self._send, client.validate, *args, **kwargs)
+
+            build_kwargs = {k: v for (k, v) in kwargs.items() if k != 'required_auth'}
+            key = cache.make_key(protocol, client._response_cache_scope(),
+                                 protocol.build_request(*args, **build_kwargs))
+
+            res = cache.get(protocol, key)
+            if res is not None:
+                client.logger.debug("%s response retrieved from the response cache",
+                                    protocol.__name__)
+                return res
+
+            res = await protocol.perform_async(self._send, client.validate, *args, **kwargs)
+            cache.put(protocol, key, res)
+
+            return res
+
+    async def _send(self, req_kwargs, desired_auth):
+        """Send a request like session.send, returning a requests.Response."""
+
+        session = self.client.session
+
+        if any(desired_auth):
+            if not session.is_authenticated:
+                raise NotLoggedIn
+
+            if desired_auth.oauth:
+                # getting an oauth token can mean a blocking refresh, so keep it off the loop
+                loop = asyncio.get_running_loop()
+                req_kwargs = await loop.run_in_executor(None, session._authorize,
+                                                        req_kwargs, desired_auth)
+            else:
+                req_kwargs = session._authorize(req_kwargs, desired_auth)
+
+        if req_kwargs.get('files'):
+            raise ValueError("file uploads can't be sent asynchronously")
+
+        headers = {k: str(v) for (k, v) in (req_kwargs.get('headers') or {}).items()
+                   if v is not None}
+
+        async with self._aiosession.request(
+                req_kwargs['method'], req_kwargs['url'],
+                params=_aiohttp_params(req_kwargs.get('params')),
+                headers=headers,
+                data=req_kwargs.get('data'),
+                allow_redirects=req_kwargs.get('allow_redirects', True),
+                ssl=None if self.client._verify_ssl else False,
+                timeout=_aiohttp_timeout(req_kwargs.get('timeout', self.timeout)),
+        ) as res:
+            content = await res.read()
+
+        response = requests.Response()
+        response.status_code = res.status
+        response.reason = res.reason
+        response.url = str(res.url)
+        response.headers = CaseInsensitiveDict(res.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = content
+
+        return response
+
+
+class AsyncMobileclient(_AsyncBase):
+    """Sends Mobileclient calls from asyncio code.
+
+    For example, to get stream urls for many songs at once::
+
+        async with AsyncMobileclient(mc) as amc:
+            urls = await asyncio.gather(*(amc.get_stream_url(i) for i in song_ids))
+
+    Methods take the same arguments and return the same results
+    as their :class:`gmusicapi.clients.Mobileclient` counterparts,
+    including using the client's ``response_cache`` and ``library_store``.
+    """
+
+    async def _make_call(self, protocol, *args, **kwargs):
+        """Switch the required_auth at runtime."""
+        if self.client._authtype is not None:
+            kwargs['required_auth'] = authtypes(**{self.client._authtype: True})
+
+        return await super()._make_call(protocol, *args, **kwargs)
+
+    async def get_all_songs(self, updated_after=None):
+        """See :func:`gmusicapi.clients.Mobileclient.get_all_songs`."""
+        return await self._get_all_items(mobileclient.ListTracks,
+                                         updated_after=updated_after)
+
+    async def get_all_playlists(self, updated_after=None):
+        """See :func:`gmusicapi.clients.Mobileclient.get_all_playlists`."""
+        return await self._get_all_items(mobileclient.ListPlaylists,
+                                         updated_after=updated_after)
+
+    async def get_all_stations(self, updated_after=None):
+        """See :func:`gmusicapi.clients.Mobileclient.get_all_stations`."""
+        return await self._get_all_items(mobileclient.ListStations,
+                                         updated_after=updated_after)
+
+    @utils.enforce_id_param
+    async def get_track_info(self, store_track_id):
+        """See :func:`gmusicapi.clients.Mobileclient.get_track_info`."""
+        return await self._make_call(mobileclient.GetStoreTrack, store_track_id)
+
+    @utils.enforce_id_param
+    async def get_album_info(self, album_id, include_tracks=True):
+        """See :func:`gmusicapi.clients.Mobileclient.get_album_info`."""
+        return await self._make_call(mobileclient.GetAlbum, album_id, include_tracks)
+
+    async def get_artist_info(self, artist_id, include_albums=True, max_top_tracks=5,
+                              max_rel_artist=5):
+        """See :func:`gmusicapi.clients.Mobileclient.get_artist_info`."""
+        return await self._make_call(mobileclient.GetArtist,
+                                     artist_id, include_albums, max_top_tracks, max_rel_artist)
+
+    @utils.enforce_id_param
+    async def get_stream_url(self, song_id, device_id=None, quality='hi'):
+        """See :func:`gmusicapi.clients.Mobileclient.get_stream_url`."""
+        if song_id.startswith('T'):
+            # the subscription status is cached, so this rarely sends anything
+            loop = asyncio.get_running_loop()
+            is_subscribed = await loop.run_in_executor(None, lambda: self.client.is_subscribed)
+
+            if not is_subscribed:
+                raise NotSubscribed("Store tracks require a subscription to stream.")
+
+        device_id = self.client._ensure_device_id(device_id)
+
+        return await self._make_call(mobileclient.GetStreamUrl, song_id, device_id, quality)
+
+    async def _get_all_items(self, call, **kwargs):
+        """Like Mobileclient._get_all_items, but never incremental."""
+
+        # slight optimization: get more items in a page
+        kwargs.setdefault('max_results', 20000)
+
+        store = self.client.library_store
+        if (store is None or call not in Mobileclient._library_store_calls or
+                kwargs.get('updated_after') is not None):
+            return [item for page in await self._get_all_pages(call, **kwargs) for item in page]
+
+        # the store is an SQLite database, so keep its queries off the loop
+        loop = asyncio.get_running_loop()
+        kind = call.__name__
+        updated_min = await loop.run_in_executor(None, store.get_updated_min, kind)
+
+        kwargs['updated_after'] = None
+        if updated_min is not None and updated_min > 0:
+            kwargs['updated_after'] = utils.microseconds_to_datetime(updated_min)
+
+        pages = await self._get_all_pages(call, **kwargs)
+        await loop.run_in_executor(None, store.sync, kind, pages)
+
+        return await loop.run_in_executor(None, store.get_items, kind)
+
+    async def _get_all_pages(self, call, **kwargs):
+        """Return a list of the listed items of each page.
+
+        kwargs are passed to the call."""
+
+        pages = []
+        next_page_token = None
+
+        while True:
+            lib_chunk = await self._make_call(call, start_token=next_page_token, **kwargs)
+
+            items = [item for item in lib_chunk['data']['items']
+                     if Mobileclient._is_listed(item, kwargs)]
+            if items:
+                pages.append(items)
+
+            prev_page_token = next_page_token
+            next_page_token = lib_chunk.get('nextPageToken')
+            if not next_page_token or next_page_token == prev_page_token:
+                return pages
+
+
+class AsyncMusicmanager(_AsyncBase):
+    """Downloads songs with a Musicmanager from asyncio code."""
+
+    async def download_song(self, song_id):
+        """Like :func:`gmusicapi.clients.Musicmanager.download_song` without *dest*:
+        returns ``(u'suggested_filename', 'audio_bytestring')``.
+
+        Interrupted downloads are not resumed.
+        """
+
+        url = (await self._make_call(musicmanager.GetDownloadLink,
+                                     song_id, self.client.uploader_id))['url']
+
+        response = await self._make_call(musicmanager.DownloadTrack, url)
+
+        cd_header = response.headers['content-disposition']
+        filename = unquote(cd_header.split("filename*=UTF-8''")[-1])
+
+        return (filename, response.content)
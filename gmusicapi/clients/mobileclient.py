@@ -1,18 +1,22 @@
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 import datetime
 from functools import partial
-from operator import itemgetter
+import itertools
 import os
 import re
 from uuid import getnode as getmac
 
+import requests
+
 from gmusicapi import session
 from gmusicapi.appdirs import my_appdirs
 from gmusicapi.clients.shared import _OAuthClient
 from gmusicapi.exceptions import CallFailure, NotSubscribed, InvalidDeviceId
 from gmusicapi.protocol import mobileclient
 from gmusicapi.protocol.shared import authtypes
-from gmusicapi.utils import utils
+from gmusicapi.utils import columnar, records, utils
 
 
 class Mobileclient(_OAuthClient):
@@ -26,14 +30,26 @@ class Mobileclient(_OAuthClient):
     _session_class = session.Mobileclient
     _authtype = None
 
+    # a gmusicapi.utils.library.LibraryStore; see get_all_songs.
+    library_store = None
+
+    # list calls that can be served from library_store
+    _library_store_calls = (mobileclient.ListTracks, mobileclient.ListPlaylists,
+                            mobileclient.ListStations)
+
     FROM_MAC_ADDRESS = object()
     OAUTH_FILEPATH = os.path.join(my_appdirs.user_data_dir, 'mobileclient.cred')
 
-    def __init__(self, debug_logging=True, validate=True, verify_ssl=True):
+    def __init__(self, debug_logging=True, validate=True, verify_ssl=True,
+                 pool_connections=10, pool_maxsize=10, timeout=None, max_retries=0):
         super().__init__(self.__class__.__name__,
                          debug_logging,
                          validate,
-                         verify_ssl)
+                         verify_ssl,
+                         pool_connections=pool_connections,
+                         pool_maxsize=pool_maxsize,
+                         timeout=timeout,
+                         max_retries=max_retries)
 
     def _make_call(self, protocol, *args, **kwargs):
         """Switch the required_auth at runtime."""
@@ -42,6 +58,10 @@ class Mobileclient(_OAuthClient):
 
         return super()._make_call(protocol, *args, **kwargs)
 
+    def _response_cache_scope(self):
+        # the session adds these to every request
+        return [self.session._locale or 'en_US', bool(self.session._is_subscribed)]
+
     def _ensure_device_id(self, device_id=None):
         if device_id is None:
             device_id = self.android_id
@@ -216,7 +236,8 @@ class Mobileclient(_OAuthClient):
 
     # TODO expose max/page-results, etc for list operations
 
-    def get_all_songs(self, incremental=False, include_deleted=None, updated_after=None):
+    def get_all_songs(self, incremental=False, include_deleted=None, updated_after=None,
+                      compact=False):
         """Returns a list of dictionaries that each represent a song.
 
         :param incremental: if True, return a generator that yields lists
@@ -227,6 +248,19 @@ class Mobileclient(_OAuthClient):
         :param include_deleted: ignored. Will be removed in a future release.
         :param updated_after: a datetime.datetime; defaults to unix epoch.
           If provided, deleted songs may be returned.
+        :param compact: if True, return :class:`gmusicapi.utils.records.Track` mappings,
+          which take several times less memory than dicts.
+
+        If ``library_store`` is set to a :class:`gmusicapi.utils.library.LibraryStore`,
+        non-incremental calls without ``updated_after`` only retrieve
+        the changes since the last call, then return the songs from the store.
+        Deleted songs are never returned from the store.
+        :func:`get_all_playlists` and :func:`get_all_stations` behave the same way::
+
+            from gmusicapi.utils.library import LibraryStore
+
+            mc.library_store = LibraryStore('/path/to/library.db')
+            songs = mc.get_all_songs()  # the first call retrieves everything
 
         Here is an example song dictionary::
 
@@ -276,10 +310,44 @@ class Mobileclient(_OAuthClient):
         """
 
         tracks = self._get_all_items(mobileclient.ListTracks, incremental,
+                                     records.Track if compact else None,
                                      updated_after=updated_after)
 
         return tracks
 
+    def export_songs(self, updated_after=None):
+        """Returns a :class:`gmusicapi.utils.columnar.SongColumns` of the songs
+        from :func:`get_all_songs`, for analysis with NumPy, Arrow or Parquet::
+
+            songs = mc.export_songs().to_arrow()
+
+        Columns are filled in as each page is retrieved,
+        so the whole library is never held as dictionaries.
+        ``library_store`` is not used.
+
+        :param updated_after: see :func:`get_all_songs`.
+        """
+
+        columns = columnar.SongColumns()
+
+        for page in self._get_all_items_incremental(mobileclient.ListTracks, max_results=20000,
+                                                    updated_after=updated_after):
+            columns.extend(page)
+
+        return columns
+
+    def iter_songs(self, updated_after=None):
+        """Returns a generator that yields the songs of :func:`get_all_songs` one at a time.
+
+        Responses are parsed as they are received,
+        so only a few songs are held in memory at once, even for very large libraries.
+        This requires `ijson <https://pypi.org/project/ijson/>`__.
+
+        :param updated_after: see :func:`get_all_songs`.
+        """
+
+        return self._iter_all_items(mobileclient.ListTracks, updated_after=updated_after)
+
     @utils.accept_singleton(dict)
     @utils.empty_arg_shortcircuit
     def rate_songs(self, songs, rating):
@@ -476,7 +544,8 @@ class Mobileclient(_OAuthClient):
         return self._make_call(mobileclient.GetStationTrackStreamUrl, song_id, wentry_id,
                                session_token, quality)
 
-    def get_all_playlists(self, incremental=False, include_deleted=None, updated_after=None):
+    def get_all_playlists(self, incremental=False, include_deleted=None, updated_after=None,
+                          compact=False):
 
         """Returns a list of dictionaries that each represent a playlist.
 
@@ -487,6 +556,8 @@ class Mobileclient(_OAuthClient):
         :param include_deleted: ignored. Will be removed in a future release.
         :param updated_after: a datetime.datetime; defaults to unix epoch
           If provided, deleted playlists may be returned.
+        :param compact: if True, return :class:`gmusicapi.utils.records.Playlist` mappings
+          instead of dicts.
 
         Here is an example playlist dictionary::
 
@@ -509,6 +580,7 @@ class Mobileclient(_OAuthClient):
         """
 
         playlists = self._get_all_items(mobileclient.ListPlaylists, incremental,
+                                        records.Playlist if compact else None,
                                         updated_after=updated_after)
 
         return playlists
@@ -575,7 +647,7 @@ class Mobileclient(_OAuthClient):
 
         return res['mutate_response'][0]['id']
 
-    def get_all_user_playlist_contents(self):
+    def get_all_user_playlist_contents(self, compact=False):
         r"""
         Retrieves the contents of *all* user-created playlists
         -- the Mobileclient does not support retrieving
@@ -623,26 +695,89 @@ class Mobileclient(_OAuthClient):
 
         (Note that the above behavior is documented for the Music Manager set to
         sync from local Folders, and may differ if it instead syncs from iTunes.)
+
+        :param compact: if True, return :class:`gmusicapi.utils.records.Playlist` mappings
+          with ``'tracks'`` lists of :class:`gmusicapi.utils.records.PlaylistEntry`
+          instead of dicts.
         """
 
-        user_playlists = [p for p in self.get_all_playlists()
-                          if (p.get('type') == 'USER_GENERATED' or
-                              p.get('type') != 'SHARED' or
-                              'type' not in p)]
+        return self._add_playlist_tracks(self._get_user_playlists(compact), compact)
+
+    def get_playlist_contents(self, playlist_ids, compact=False):
+        """Retrieves the contents of some user-created playlists.
+
+        Returns playlists like :func:`get_all_user_playlist_contents`,
+        in the order of *playlist_ids*.
+        Ids that aren't of the user's playlists are ignored.
+
+        All playlist entries are still retrieved, but only those of these playlists are kept,
+        which takes much less memory and time than retrieving every playlist's contents.
+
+        :param playlist_ids: an iterable of playlist ids.
+        :param compact: see :func:`get_all_user_playlist_contents`.
+        """
+
+        playlists_by_id = {p['id']: p for p in self._get_user_playlists(compact)}
+
+        playlists = []
+        for playlist_id in dict.fromkeys(playlist_ids):
+            if playlist_id in playlists_by_id:
+                playlists.append(playlists_by_id[playlist_id])
 
-        all_entries = self._get_all_items(mobileclient.ListPlaylistEntries,
-                                          incremental=False,
-                                          updated_after=None)
+        return self._add_playlist_tracks(playlists, compact)
 
-        for playlist in user_playlists:
-            # TODO could use a dict to make this faster
-            entries = [e for e in all_entries
-                       if e['playlistId'] == playlist['id']]
-            entries.sort(key=itemgetter('absolutePosition'))
+    def _get_user_playlists(self, compact):
+        """Return the playlists that the user created, leaving out shared playlists."""
 
-            playlist['tracks'] = entries
+        return [p for p in self.get_all_playlists(compact=compact)
+                if (p.get('type') == 'USER_GENERATED' or
+                    p.get('type') != 'SHARED' or
+                    'type' not in p)]
 
-        return user_playlists
+    def _add_playlist_tracks(self, playlists, compact):
+        """Retrieve all playlist entries, and set each playlist's ``'tracks'``
+        to its entries, in order. Return playlists."""
+
+        tracks = {p['id']: [] for p in playlists}
+
+        # entries are grouped a page at a time, so entries of other playlists aren't kept
+        pages = self._get_all_items(mobileclient.ListPlaylistEntries,
+                                    incremental=True,
+                                    record_class=records.PlaylistEntry if compact else None,
+                                    updated_after=None,
+                                    max_results=20000)
+
+        for page in pages:
+            for entry in page:
+                playlist_tracks = tracks.get(entry['playlistId'])
+                if playlist_tracks is not None:
+                    playlist_tracks.append(entry)
+
+        for playlist in playlists:
+            entries = tracks[playlist['id']]
+            entries.sort(key=_absolute_position)
+
+            if compact:
+                playlist.tracks = entries
+            else:
+                playlist['tracks'] = entries
+
+        return playlists
+
+    def iter_playlist_entries(self, updated_after=None):
+        """Returns a generator that yields the entries of all user-created playlists
+        one at a time, in no particular order.
+
+        Entries are structured like those of :func:`get_all_user_playlist_contents`.
+        Like :func:`iter_songs`, responses are parsed as they are received,
+        and `ijson <https://pypi.org/project/ijson/>`__ is required.
+
+        :param updated_after: a datetime.datetime; defaults to unix epoch.
+          If provided, deleted entries may be returned.
+        """
+
+        return self._iter_all_items(mobileclient.ListPlaylistEntries,
+                                    updated_after=updated_after)
 
     def get_shared_playlist_contents(self, share_token):
         """
@@ -673,7 +808,7 @@ class Mobileclient(_OAuthClient):
                               updated_after=None, share_token=share_token)
 
         entries = res['entries'][0]['playlistEntry']
-        entries.sort(key=itemgetter('absolutePosition'))
+        entries.sort(key=_absolute_position)
 
         return entries
 
@@ -2053,10 +2188,12 @@ class Mobileclient(_OAuthClient):
                               artist_id, include_albums, max_top_tracks, max_rel_artist)
         return res
 
-    def _get_all_items(self, call, incremental, **kwargs):
+    def _get_all_items(self, call, incremental, record_class=None, **kwargs):
         """
         :param call: protocol.McCall
         :param incremental: bool
+        :param record_class: (optional) a gmusicapi.utils.records class to return items as.
+          Pages are converted as they're retrieved.
 
         kwargs are passed to the call.
         """
@@ -2064,14 +2201,49 @@ class Mobileclient(_OAuthClient):
             # slight optimization: get more items in a page
             kwargs.setdefault('max_results', 20000)
 
+            if (self.library_store is not None and call in self._library_store_calls and
+                    kwargs.get('updated_after') is None):
+                items = self._get_all_items_from_store(call, **kwargs)
+                if record_class is not None:
+                    items = [record_class(i) for i in items]
+                return items
+
         generator = self._get_all_items_incremental(call, **kwargs)
+        if record_class is not None:
+            generator = ([record_class(i) for i in chunk] for chunk in generator)
+
         if incremental:
             return generator
 
         return [s for chunk in generator for s in chunk]
 
+    def _get_all_items_from_store(self, call, **kwargs):
+        """Sync library_store with the changes since its last sync, then
+        return all of its items for this call.
+
+        kwargs are passed to the call."""
+
+        kind = call.__name__
+        updated_min = self.library_store.get_updated_min(kind)
+
+        kwargs['updated_after'] = None
+        if updated_min is not None and updated_min > 0:
+            kwargs['updated_after'] = utils.microseconds_to_datetime(updated_min)
+
+        self.library_store.sync(kind, self._get_all_items_incremental(call, **kwargs))
+
+        return self.library_store.get_items(kind)
+
     def _get_all_items_incremental(self, call, **kwargs):
         """Return a generator of lists of tracks.
+        Pages are retrieved ahead of the caller if prefetch_pages is set.
+
+        kwargs are passed to the call."""
+
+        return utils.prefetch(self._get_all_pages(call, **kwargs), self.prefetch_pages)
+
+    def _get_all_pages(self, call, **kwargs):
+        """Return a generator of lists of tracks.
 
         kwargs are passed to the call."""
 
@@ -2084,14 +2256,8 @@ class Mobileclient(_OAuthClient):
                                         start_token=next_page_token,
                                         **kwargs)
 
-            items = []
-
-            for item in lib_chunk['data']['items']:
-                if 'userPreferences' in item:
-                    if item['userPreferences'].get('subscribed', False):
-                        items.append(item)
-                elif ('updated_after' in kwargs) or (not item.get('deleted', False)):
-                    items.append(item)
+            items = [item for item in lib_chunk['data']['items']
+                     if self._is_listed(item, kwargs)]
 
             # Conditional prevents generator from yielding empty
             # list for last page of podcast list calls.
@@ -2106,6 +2272,54 @@ class Mobileclient(_OAuthClient):
 
             get_next_chunk = (next_page_token and next_page_token != prev_page_token)
 
+    def _iter_all_items(self, call, **kwargs):
+        """Return a generator of the items of _get_all_items,
+        parsed one at a time from streamed responses.
+
+        kwargs are passed to the call."""
+
+        # pages aren't held in memory, so get as many as possible at once
+        kwargs.setdefault('max_results', 20000)
+
+        streamed_call = call.streamed()
+
+        def iter_items():
+            next_page_token = None
+
+            while True:
+                response = self._make_call(streamed_call, start_token=next_page_token, **kwargs)
+
+                prev_page_token = next_page_token
+
+                with closing(response):
+                    page_items = call.iter_items(response, self.validate)
+
+                    while True:
+                        try:
+                            item = next(page_items)
+                        except StopIteration as e:
+                            next_page_token = e.value
+                            break
+
+                        if self._is_listed(item, kwargs):
+                            yield item
+
+                if not next_page_token or next_page_token == prev_page_token:
+                    return
+
+        return iter_items()
+
+    @staticmethod
+    def _is_listed(item, kwargs):
+        """Return True if an item from a list call should be returned to the caller.
+
+        kwargs are those passed to the call."""
+
+        if 'userPreferences' in item:
+            return item['userPreferences'].get('subscribed', False)
+
+        return ('updated_after' in kwargs) or (not item.get('deleted', False))
+
     @utils.enforce_id_param
     def get_album_info(self, album_id, include_tracks=True):
         """Retrieves details on an album.
@@ -2193,6 +2407,110 @@ class Mobileclient(_OAuthClient):
 
         return self._make_call(mobileclient.GetStoreTrack, store_track_id)
 
+    def get_track_info_many(self, store_track_ids, workers=8, incremental=False):
+        """Retrieves information about many store tracks at once.
+
+        Returns a list of ``(store_track_id, info, error)`` tuples
+        in the order of *store_track_ids*.
+        *info* is what :func:`get_track_info` returns for the id.
+        If retrieving it failed, *info* is ``None`` and *error* is the exception;
+        otherwise *error* is ``None``.
+
+        Repeated ids are only retrieved once.
+        *store_track_ids* is read as it's needed, rather than all up front.
+
+        :param store_track_ids: an iterable of store track ids
+        :param workers: the number of requests to make at once
+        :param incremental: if True, return a generator that yields the tuples
+          in order as they are retrieved, rather than a list.
+        """
+
+        return self._get_info_many(mobileclient.GetStoreTrack, store_track_ids,
+                                   workers, incremental)
+
+    def get_album_info_many(self, album_ids, include_tracks=True, workers=8, incremental=False):
+        """Retrieves details on many albums at once.
+
+        Returns ``(album_id, info, error)`` tuples like :func:`get_track_info_many`,
+        where *info* is what :func:`get_album_info` returns.
+
+        :param album_ids: an iterable of album ids
+        :param include_tracks: when True, create the ``'tracks'`` substructure
+
+        See :func:`get_track_info_many` for the other params.
+        """
+
+        return self._get_info_many(mobileclient.GetAlbum, album_ids,
+                                   workers, incremental, include_tracks)
+
+    def get_artist_info_many(self, artist_ids, include_albums=True, max_top_tracks=5,
+                             max_rel_artist=5, workers=8, incremental=False):
+        """Retrieves details on many artists at once.
+
+        Returns ``(artist_id, info, error)`` tuples like :func:`get_track_info_many`,
+        where *info* is what :func:`get_artist_info` returns.
+
+        :param artist_ids: an iterable of artist ids
+
+        See :func:`get_artist_info` and :func:`get_track_info_many` for the other params.
+        """
+
+        return self._get_info_many(mobileclient.GetArtist, artist_ids,
+                                   workers, incremental,
+                                   include_albums, max_top_tracks, max_rel_artist)
+
+    def _get_info_many(self, call, ids, workers, incremental, *args):
+        """Make call for each unique id on a thread pool.
+
+        args are passed to the call after the id."""
+
+        results = self._iter_info_many(call, ids, workers, args)
+
+        if incremental:
+            return results
+
+        return list(results)
+
+    def _iter_info_many(self, call, ids, workers, args):
+        """Yield (id, info, error) for each of ids, in order.
+
+        ids are read as they're needed, so they can be a long or slow iterable."""
+
+        def get_info(item_id):
+            try:
+                return self._make_call(call, item_id, *args), None
+            except (CallFailure, requests.RequestException) as e:
+                self.logger.info("could not retrieve %s for %s: %s", call.__name__, item_id, e)
+                return None, e
+
+        ids = iter(ids)
+
+        # {id: future} of every id seen, so repeats anywhere in ids share a request
+        futures = {}
+        pending = deque()
+
+        # only run a little ahead of the caller, so results don't pile up
+        max_pending = 2 * workers
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                for item_id in itertools.islice(ids, max_pending - len(pending)):
+                    if not isinstance(item_id, str):
+                        raise ValueError("Invalid id %r; expected an id"
+                                         " (did you pass a dictionary?)" % (item_id,))
+
+                    if item_id not in futures:
+                        futures[item_id] = executor.submit(get_info, item_id)
+                    pending.append(item_id)
+
+                if not pending:
+                    return
+
+                item_id = pending.popleft()
+                info, error = futures[item_id].result()
+
+                yield item_id, info, error
+
     @utils.enforce_id_param
     def get_station_info(self, station_id, num_tracks=25):
         """Retrieves information about a station.
@@ -2327,3 +2645,8 @@ class Mobileclient(_OAuthClient):
 
         # An invalid parent genre won't respond with a genres key.
         return res.get('genres', [])
+
+
+def _absolute_position(entry):
+    """Return the position of a playlist entry as an int, for sorting."""
+    return int(entry['absolutePosition'])
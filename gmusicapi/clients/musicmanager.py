@@ -1,11 +1,21 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing
+from functools import partial
+import hashlib
+import io
+import itertools
+import json
 import os
 from socket import gethostname
+import threading
 import time
+import traceback
 from uuid import getnode as getmac
 from urllib.parse import unquote
 
 import httplib2  # included with oauth2client
 from oauth2client.client import TokenRevokeError
+import requests
 
 import gmusicapi
 from gmusicapi.clients.shared import _OAuthClient
@@ -33,13 +43,24 @@ class Musicmanager(_OAuthClient):
     """
     OAUTH_FILEPATH = os.path.join(my_appdirs.user_data_dir, 'oauth.cred')
 
+    # the name of the manifest file that download_library writes
+    DOWNLOAD_MANIFEST_FILENAME = '.gmusicapi_manifest.jsonl'
+
+    # a gmusicapi.utils.trackcache.TrackInfoCache used by upload, or None
+    track_info_cache = None
+
     _session_class = session.Musicmanager
 
-    def __init__(self, debug_logging=True, validate=True, verify_ssl=True):
+    def __init__(self, debug_logging=True, validate=True, verify_ssl=True,
+                 pool_connections=10, pool_maxsize=10, timeout=None, max_retries=0):
         super().__init__(self.__class__.__name__,
                          debug_logging,
                          validate,
-                         verify_ssl)
+                         verify_ssl,
+                         pool_connections=pool_connections,
+                         pool_maxsize=pool_maxsize,
+                         timeout=timeout,
+                         max_retries=max_retries)
 
     def login(self, oauth_credentials=OAUTH_FILEPATH,
               uploader_id=None, uploader_name=None):
@@ -222,6 +243,12 @@ class Musicmanager(_OAuthClient):
                  'total_disc_count')}
 
     def _get_all_songs(self, export_type=1):
+        """Return a generator of song chunks.
+        Chunks are retrieved ahead of the caller if prefetch_pages is set."""
+
+        return utils.prefetch(self._get_all_song_chunks(export_type), self.prefetch_pages)
+
+    def _get_all_song_chunks(self, export_type):
         """Return a generator of song chunks."""
 
         get_next_chunk = True
@@ -244,7 +271,7 @@ class Musicmanager(_OAuthClient):
             get_next_chunk = lib_chunk.HasField('continuation_token')
 
     @utils.enforce_id_param
-    def download_song(self, song_id):
+    def download_song(self, song_id, dest=None, max_retries=3):
         """Download an uploaded or purchased song from your library.
 
         Subscription tracks can't be downloaded with this method.
@@ -258,6 +285,22 @@ class Musicmanager(_OAuthClient):
 
         :param song_id: a single uploaded or purchased song id.
 
+        :param dest: (optional) a filepath or writable binary file object.
+          If provided, the audio is written here as it's received,
+          rather than held in memory,
+          and ``(u'suggested_filename', number_of_bytes)`` is returned.
+          File objects don't need to be seekable (eg pipes), but then a dropped
+          download can't be resumed if the server ignores the requested range.
+
+          A filepath is first downloaded to ``dest + '.part'``, then renamed.
+          If a ``.part`` file exists from an interrupted download,
+          the download resumes where it left off.
+
+        :param max_retries: the number of times to resume a download
+          after the connection drops.
+
+        ``CallFailure`` is raised if the full track could not be retrieved.
+
         To write the song to disk, use something like::
 
             filename, audio = mm.download_song(an_id)
@@ -268,6 +311,10 @@ class Musicmanager(_OAuthClient):
             with open(filename, 'wb') as f:
                 f.write(audio)
 
+        or, without holding the song in memory::
+
+            filename, _ = mm.download_song(an_id, dest='song.mp3')
+
         Unlike with :py:func:`Webclient.get_song_download_info
         <gmusicapi.clients.Webclient.get_song_download_info>`,
         there is no download limit when using this interface.
@@ -277,17 +324,207 @@ class Musicmanager(_OAuthClient):
         will produce an http 500.
         """
 
-        url = self._make_call(musicmanager.GetDownloadLink,
-                              song_id,
-                              self.uploader_id)['url']
+        if dest is None:
+            f = io.BytesIO()
+            filename, _ = self._download_song_to(song_id, f, max_retries, resume=False)
+            return (filename, f.getvalue())
+
+        if not isinstance(dest, str):
+            return self._download_song_to(song_id, dest, max_retries, resume=False)
+
+        part_path = dest + '.part'
+        with open(part_path, 'ab') as f:
+            filename, size = self._download_song_to(song_id, f, max_retries, resume=True)
+
+        os.replace(part_path, dest)
+
+        return (filename, size)
+
+    def _download_song_to(self, song_id, f, max_retries, resume):
+        """Write a song to the binary file object f.
+        Return (suggested_filename, size).
+
+        :param resume: if True, treat everything before f.tell() as the
+          start of the song, and only download the rest.
+          f must be seekable.
+
+        See download_song for other params."""
+
+        # pipes and sockets can't tell or seek; count from where they are
+        start_pos = None
+        written = 0
+        if f.seekable():
+            if resume:
+                written = f.tell()
+            start_pos = f.tell() - written
+
+        attempts = 0
+
+        while True:
+            # links expire, so get a fresh one for every attempt.
+            url = self._make_call(musicmanager.GetDownloadLink,
+                                  song_id,
+                                  self.uploader_id)['url']
+
+            # To resume, ask for the last byte we already have as well.
+            # This ensures the server always has something to send
+            # (and a filename to suggest), even if we have the whole track.
+            range_start = written - 1 if written else None
+            response = self._make_call(musicmanager.DownloadTrack, url, range_start)
+
+            with closing(response):
+                cd_header = response.headers['content-disposition']
+                filename = unquote(cd_header.split("filename*=UTF-8''")[-1])
+
+                chunks = response.iter_content(chunk_size=64 * 1024)
+                total = _get_download_size(response, range_start)
+
+                if range_start is not None:
+                    if total is None:
+                        if start_pos is None:
+                            raise CallFailure("server ignored download range for %s,"
+                                              " and %s bytes already written can't be"
+                                              " rewound" % (song_id, written),
+                                              musicmanager.DownloadTrack.__name__)
+
+                        self.logger.info("server ignored download range for %s; restarting",
+                                         song_id)
+                        f.seek(start_pos)
+                        f.truncate()
+                        written = 0
+                        total = _get_download_size(response, None)
+                    else:
+                        chunks = _skip_bytes(chunks, 1)
+
+                interrupted = False
+                try:
+                    for chunk in chunks:
+                        f.write(chunk)
+                        written += len(chunk)
+
+                except requests.RequestException as e:
+                    interrupted = True
+                    self.logger.info("download of %s interrupted at %s of %s bytes: %s",
+                                     song_id, written, total, e)
+
+            # without a size, only an uninterrupted response is known to be complete
+            if (total is None and not interrupted) or written == total:
+                return (filename, written)
+
+            if total is not None and written > total:
+                raise CallFailure("received %s bytes for %s, but expected %s" %
+                                  (written, song_id, total),
+                                  musicmanager.DownloadTrack.__name__)
+
+            attempts += 1
+            if attempts > max_retries:
+                raise CallFailure("giving up on download of %s after %s attempts:"
+                                  " received %s of %s bytes" %
+                                  (song_id, attempts, written,
+                                   total if total is not None else 'unknown'),
+                                  musicmanager.DownloadTrack.__name__)
+
+    def download_library(self, dest_dir, workers=1):
+        """Download all uploaded and purchased songs to a directory.
+        Returns a tuple ``(downloaded, not_downloaded)`` of dicts:
+        ``{song_id: filepath}`` and ``{song_id: reason}``.
+
+        Songs are saved with their suggested filenames (see :func:`download_song`);
+        a number is added to the filename if it's already taken.
+
+        As each song finishes, a line of json is appended to a manifest file in *dest_dir*
+        (named by :attr:`DOWNLOAD_MANIFEST_FILENAME`) with the keys
+        ``('id', 'filename', 'size', 'md5')``.
+        Songs in the manifest are skipped when this is run again with the same *dest_dir*,
+        so an interrupted backup can be resumed. Partially downloaded songs are resumed, too.
+
+        :param dest_dir: the directory to download to. It will be created if needed.
+        :param workers: the number of songs to download at once.
+        """
+
+        utils.make_sure_path_exists(dest_dir)
+        manifest_path = os.path.join(dest_dir, self.DOWNLOAD_MANIFEST_FILENAME)
+
+        downloaded = {}
+        not_downloaded = {}
+
+        # skip songs that finished on previous runs
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a line that was cut off while being written
+
+                    filepath = os.path.join(dest_dir, entry['filename'])
+                    if os.path.isfile(filepath):
+                        downloaded[entry['id']] = filepath
+
+        song_ids = []
+        seen_ids = set(downloaded)
+        for song in itertools.chain(self.get_uploaded_songs(), self.get_purchased_songs()):
+            if song['id'] not in seen_ids:
+                seen_ids.add(song['id'])
+                song_ids.append(song['id'])
+
+        self.logger.info("downloading %s songs; %s already downloaded",
+                         len(song_ids), len(downloaded))
+
+        manifest_lock = threading.Lock()
+
+        with open(manifest_path, 'a', encoding='utf-8') as manifest:
+            download = partial(self._download_library_song, dest_dir, manifest, manifest_lock)
+
+            for song_id, filepath, error in _map_concurrently(download, song_ids, workers):
+                if error is not None:
+                    not_downloaded[song_id] = error
+                else:
+                    downloaded[song_id] = filepath
+
+        return downloaded, not_downloaded
+
+    def _download_library_song(self, dest_dir, manifest, manifest_lock, song_id):
+        """Download a song during download_library, then record it in the manifest.
+
+        Return (song_id, filepath, None) on success, or (song_id, None, reason) on failure."""
 
-        response = self._make_call(musicmanager.DownloadTrack, url)
+        # a name that can't collide with a suggested filename;
+        # download_song resumes from a '.part' file here.
+        temp_path = os.path.join(dest_dir, song_id + '.download')
 
-        cd_header = response.headers['content-disposition']
+        try:
+            filename, size = self.download_song(song_id, dest=temp_path)
+
+            md5 = hashlib.md5()
+            with open(temp_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(64 * 1024), b''):
+                    md5.update(chunk)
+
+        except (CallFailure, OSError) as e:
+            self.logger.warning("could not download %s: %s", song_id, e)
+            return song_id, None, str(e)
+
+        # the server's suggestion is not necessarily safe
+        filename = filename.replace(os.sep, '_').replace('/', '_')
+        root, ext = os.path.splitext(filename)
+
+        with manifest_lock:
+            num = 1
+            while os.path.exists(os.path.join(dest_dir, filename)):
+                filename = "%s (%s)%s" % (root, num, ext)
+                num += 1
+
+            filepath = os.path.join(dest_dir, filename)
+            os.replace(temp_path, filepath)
+
+            manifest.write(json.dumps({'id': song_id, 'filename': filename,
+                                       'size': size, 'md5': md5.hexdigest()}) + '\n')
+            manifest.flush()
 
-        filename = unquote(cd_header.split("filename*=UTF-8''")[-1])
+        self.logger.info("downloaded %s to '%r'", song_id, filepath)
 
-        return (filename, response.content)
+        return song_id, filepath, None
 
     def get_quota(self):
         """Returns a tuple of (number of uploaded tracks, allowed number of uploaded tracks)."""
@@ -305,7 +542,8 @@ class Musicmanager(_OAuthClient):
     @utils.accept_singleton(str)
     @utils.empty_arg_shortcircuit(return_code='{}')
     def upload(self, filepaths, enable_matching=False,
-               enable_transcoding=True, transcode_quality='320k'):
+               enable_transcoding=True, transcode_quality='320k',
+               workers=1, concurrent_uploads=1):
         """Uploads the given filepaths.
 
         All non-mp3 files will be transcoded before being uploaded.
@@ -349,6 +587,21 @@ class Musicmanager(_OAuthClient):
           If string, pass to ffmpeg/avconv ``-b:a`` (eg ``'128k'`` for an average bitrate of 128k).
           The default is 320kbps cbr (the highest possible quality).
 
+        :param workers: the number of processes used to read local files,
+          and the number of threads used to create scan and match samples.
+          The default of 1 does all of this work in the calling thread.
+
+        :param concurrent_uploads: the maximum number of files that will be
+          uploaded at once.
+          While waiting on the server to provide an upload session for one file,
+          others can be transcoded and sent.
+
+        If ``track_info_cache`` is set to a :class:`gmusicapi.utils.trackcache.TrackInfoCache`,
+        local metadata is only read from files that are new or have changed since
+        they were last seen::
+
+            mm.track_info_cache = TrackInfoCache('/path/to/tracks.db')
+
         All Google-supported filetypes are supported; see `Google's documentation
         <http://support.google.com/googleplay/bin/answer.py?hl=en&answer=1100462>`__.
 
@@ -363,24 +616,45 @@ class Musicmanager(_OAuthClient):
                               " run Api.login(...perform_upload_auth=True...)"
                               " first.")
 
-        # TODO there is way too much code in this function.
-
         # To return.
         uploaded = {}
         matched = {}
         not_uploaded = {}
 
-        # Gather local information on the files.
+        # Gather local information on the files, skipping any we've seen before.
         local_info = {}  # {clientid: (path, Track)}
-        for path in filepaths:
-            try:
-                track = musicmanager.UploadMetadata.fill_track_info(path)
-            except BaseException as e:
-                self.logger.exception("problem gathering local info of '%r'", path)
+        cached = []
+        to_gather = filepaths
+        file_keys = {}
+
+        if self.track_info_cache is not None:
+            to_gather = []
+            for path in filepaths:
+                file_keys[path] = self.track_info_cache.file_key(path)
+                track = self.track_info_cache.get(path, file_keys[path])
+
+                if track is None:
+                    to_gather.append(path)
+                else:
+                    cached.append((path, track, None))
+
+            self.logger.info("using cached track info for %s of %s files",
+                             len(cached), len(filepaths))
+
+        gathered = list(_map_concurrently(_gather_track_info, to_gather, workers,
+                                          use_processes=True))
 
-                user_err_msg = str(e)
+        if self.track_info_cache is not None:
+            self.track_info_cache.update((path, file_keys[path], track)
+                                         for (path, track, error) in gathered
+                                         if track is not None)
 
-                if 'Non-ASCII strings must be converted to unicode' in str(e):
+        for path, track, error in itertools.chain(cached, gathered):
+            if track is None:
+                user_err_msg, tb = error
+                self.logger.error("problem gathering local info of '%r'\n%s", path, tb)
+
+                if 'Non-ASCII strings must be converted to unicode' in user_err_msg:
                     # This is a protobuf-specific error; they require either ascii or unicode.
                     # To keep behavior consistent, make no effort to guess - require users
                     # to decode first.
@@ -389,6 +663,7 @@ class Musicmanager(_OAuthClient):
 
                 not_uploaded[path] = user_err_msg
             else:
+                track = locker_pb2.Track.FromString(track)
                 local_info[track.client_id] = (path, track)
 
         if not local_info:
@@ -408,24 +683,17 @@ class Musicmanager(_OAuthClient):
         sample_requests = [req for req in md_res.signed_challenge_info]
 
         # Send scan and match samples if requested.
-        for sample_request in sample_requests:
-            path, track = local_info[sample_request.challenge_info.client_track_id]
-
-            bogus_sample = None
-            if not enable_matching:
-                bogus_sample = b''  # just send empty bytes
+        bogus_sample = None
+        if not enable_matching:
+            bogus_sample = b''  # just send empty bytes
 
-            try:
-                res = self._make_call(musicmanager.ProvideSample,
-                                      path, sample_request, track,
-                                      self.uploader_id, bogus_sample)
+        provide_sample = partial(self._provide_sample, local_info, bogus_sample)
 
-            except (OSError, ValueError) as e:
-                self.logger.warning("couldn't create scan and match sample for '%r': %s",
-                                    path, str(e))
-                not_uploaded[path] = str(e)
+        for path, sample_res, error in _map_concurrently(provide_sample, sample_requests, workers):
+            if error is not None:
+                not_uploaded[path] = error
             else:
-                responses.extend(res.sample_response.track_sample_response)
+                responses.extend(sample_res.sample_response.track_sample_response)
 
         # Read sample responses and prep upload requests.
         to_upload = {}  # {serverid: (path, Track, do_not_rematch?)}
@@ -465,78 +733,195 @@ class Musicmanager(_OAuthClient):
             # TODO reordering requests could avoid wasting time waiting for reup sync
             self._make_call(musicmanager.UpdateUploadState, 'start', self.uploader_id)
 
-            for server_id, (path, track, do_not_rematch) in to_upload.items():
-                # It can take a few tries to get an session.
+            upload_track = partial(self._try_upload_track, uploaded,
+                                   enable_transcoding, transcode_quality)
+
+            try:
+                for path, error in _map_concurrently(
+                        upload_track, to_upload.items(), concurrent_uploads):
+                    if error is not None:
+                        not_uploaded[path] = error
+            finally:
+                self._make_call(musicmanager.UpdateUploadState, 'stopped', self.uploader_id)
+
+        return uploaded, matched, not_uploaded
+
+    def _provide_sample(self, local_info, bogus_sample, sample_request):
+        """Send a scan and match sample during upload.
+
+        Return (path, ProvideSample response, None) on success,
+        or (path, None, reason) on failure."""
+
+        path, track = local_info[sample_request.challenge_info.client_track_id]
+
+        try:
+            res = self._make_call(musicmanager.ProvideSample,
+                                  path, sample_request, track,
+                                  self.uploader_id, bogus_sample)
+
+        except (OSError, ValueError) as e:
+            self.logger.warning("couldn't create scan and match sample for '%r': %s",
+                                path, str(e))
+            return path, None, str(e)
+
+        return path, res, None
+
+    def _try_upload_track(self, uploaded, enable_transcoding, transcode_quality,
+                          to_upload_item):
+        """Like _upload_track, but an exception is returned as the track's failure,
+        so one track can't stop the others from being uploaded."""
+
+        path = to_upload_item[1][0]
+
+        try:
+            return self._upload_track(uploaded, enable_transcoding, transcode_quality,
+                                      to_upload_item)
+        except Exception as e:
+            self.logger.exception("problem uploading '%r'", path)
+            return path, "upload error: %s" % e
+
+    def _upload_track(self, uploaded, enable_transcoding, transcode_quality, to_upload_item):
+        """Get an upload session for a file, then send it.
+
+        Return (path, None) on success, or (path, reason) on failure.
+
+        :param uploaded: the {path: server_id} of files uploaded so far.
+          It is updated as soon as this file is uploaded, since the server
+          expects a count of earlier uploads when handing out sessions.
+        :param to_upload_item: a (server_id, (path, Track, do_not_rematch)) pair.
+        """
+
+        server_id, (path, track, do_not_rematch) = to_upload_item
+
+        # It can take a few tries to get an session.
+        should_retry = True
+        attempts = 0
+
+        while should_retry and attempts < 10:
+            session = self._make_call(musicmanager.GetUploadSession,
+                                      self.uploader_id, len(uploaded),
+                                      track, path, server_id, do_not_rematch)
+            attempts += 1
+
+            got_session, error_details = \
+                musicmanager.GetUploadSession.process_session(session)
+
+            if got_session:
+                self.logger.info("got an upload session for '%r'", path)
+                break
+
+            should_retry, reason, error_code = error_details
+            self.logger.debug("problem getting upload session: %s\ncode=%s retrying=%s",
+                              reason, error_code, should_retry)
+
+            if error_code == 200 and do_not_rematch:
+                # reupload requests need to wait on a server sync
+                # 200 == already uploaded, so force a retry in this case
                 should_retry = True
-                attempts = 0
 
-                while should_retry and attempts < 10:
-                    session = self._make_call(musicmanager.GetUploadSession,
-                                              self.uploader_id, len(uploaded),
-                                              track, path, server_id, do_not_rematch)
-                    attempts += 1
+            time.sleep(6)  # wait before retrying
+        else:
+            err_msg = "GetUploadSession error %s: %s" % (error_code, reason)
 
-                    got_session, error_details = \
-                        musicmanager.GetUploadSession.process_session(session)
+            self.logger.warning("giving up on upload session for '%r': %s", path, err_msg)
+            return path, err_msg
 
-                    if got_session:
-                        self.logger.info("got an upload session for '%r'", path)
-                        break
+        # got a session, do the upload
+        # this terribly inconsistent naming isn't my fault: Google--
+        session = session['sessionStatus']
+        external = session['externalFieldTransfers'][0]
 
-                    should_retry, reason, error_code = error_details
-                    self.logger.debug("problem getting upload session: %s\ncode=%s retrying=%s",
-                                      reason, error_code, should_retry)
+        session_url = external['putInfo']['url']
+        content_type = external.get('content_type', 'audio/mpeg')
 
-                    if error_code == 200 and do_not_rematch:
-                        # reupload requests need to wait on a server sync
-                        # 200 == already uploaded, so force a retry in this case
-                        should_retry = True
+        # the audio is streamed from disk or the transcoder, rather than read into memory.
+        if track.original_content_type != locker_pb2.Track.MP3:
+            if not enable_transcoding:
+                return path, "transcoding disabled"
 
-                    time.sleep(6)  # wait before retrying
-                else:
-                    err_msg = "GetUploadSession error %s: %s" % (error_code, reason)
-
-                    self.logger.warning("giving up on upload session for '%r': %s", path, err_msg)
-                    not_uploaded[path] = err_msg
-
-                    continue  # to next upload
-
-                # got a session, do the upload
-                # this terribly inconsistent naming isn't my fault: Google--
-                session = session['sessionStatus']
-                external = session['externalFieldTransfers'][0]
-
-                session_url = external['putInfo']['url']
-                content_type = external.get('content_type', 'audio/mpeg')
-
-                if track.original_content_type != locker_pb2.Track.MP3:
-                    if enable_transcoding:
-                        try:
-                            self.logger.info("transcoding '%r' to mp3", path)
-                            contents = utils.transcode_to_mp3(path, quality=transcode_quality)
-                        except (OSError, ValueError) as e:
-                            self.logger.warning("error transcoding %r: %s", path, e)
-                            not_uploaded[path] = "transcoding error: %s" % e
-                            continue
-                    else:
-                        not_uploaded[path] = "transcoding disabled"
-                        continue
-                else:
-                    with open(path, 'rb') as f:
-                        contents = f.read()
+            try:
+                self.logger.info("transcoding '%r' to mp3", path)
+                contents = utils.iter_transcode_to_mp3(path, quality=transcode_quality)
 
+                # transcoding problems can also surface while sending
                 upload_response = self._make_call(musicmanager.UploadFile,
                                                   session_url, content_type, contents)
+            except (OSError, ValueError) as e:
+                self.logger.warning("error transcoding %r: %s", path, e)
+                return path, "transcoding error: %s" % e
+        else:
+            with open(path, 'rb') as f:
+                upload_response = self._make_call(musicmanager.UploadFile,
+                                                  session_url, content_type, f)
 
-                success = upload_response.get('sessionStatus', {}).get('state')
-                if success:
-                    uploaded[path] = server_id
-                else:
-                    # 404 == already uploaded? serverside check on clientid?
-                    self.logger.debug("could not finalize upload of '%r'. response: %s",
-                                      path, upload_response)
-                    not_uploaded[path] = 'could not finalize upload; details in log'
+        success = upload_response.get('sessionStatus', {}).get('state')
+        if not success:
+            # 404 == already uploaded? serverside check on clientid?
+            self.logger.debug("could not finalize upload of '%r'. response: %s",
+                              path, upload_response)
+            return path, 'could not finalize upload; details in log'
 
-            self._make_call(musicmanager.UpdateUploadState, 'stopped', self.uploader_id)
+        uploaded[path] = server_id
+        return path, None
 
-        return uploaded, matched, not_uploaded
+
+def _gather_track_info(path):
+    """Return (path, serialized locker_pb2.Track, None) for a local file,
+    or (path, None, (error message, formatted traceback)) on problems.
+
+    This runs in worker processes during Musicmanager.upload.
+    Tracks are serialized since generated protobuf classes can't be pickled."""
+
+    try:
+        track = musicmanager.UploadMetadata.fill_track_info(path)
+    except BaseException as e:
+        return path, None, (str(e), traceback.format_exc())
+
+    return path, track.SerializeToString(), None
+
+
+def _map_concurrently(func, iterable, workers, use_processes=False):
+    """Return an iterator of func applied to each item, in order.
+
+    :param workers: the number of threads (or processes) to use.
+      If 1, run in the calling thread.
+    :param use_processes: if True, use a process pool instead of a thread pool.
+      func must be picklable.
+    """
+
+    if workers <= 1:
+        return map(func, iterable)
+
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        return list(executor.map(func, iterable))
+
+
+def _get_download_size(response, range_start):
+    """Return the full size of a download in bytes, or None if it isn't known.
+
+    If range_start is given, return None unless the response honors the range."""
+
+    if range_start is None:
+        length = response.headers.get('content-length')
+        return int(length) if length is not None else None
+
+    # eg 'bytes 100-199/200'
+    content_range = response.headers.get('content-range', '')
+    if response.status_code != 206 or not content_range.startswith('bytes %s-' % range_start):
+        return None
+
+    return int(content_range.split('/')[-1])
+
+
+def _skip_bytes(chunks, num_bytes):
+    """Yield from chunks after skipping the first num_bytes."""
+
+    for chunk in chunks:
+        if num_bytes:
+            skipped = chunk[:num_bytes]
+            chunk = chunk[num_bytes:]
+            num_bytes -= len(skipped)
+
+        if chunk:
+            yield chunk
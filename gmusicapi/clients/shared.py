@@ -1,19 +1,54 @@
+import functools
+import inspect
 import logging
 import os
 
 from gmusicapi.utils import utils
 from oauth2client.client import OAuth2WebServerFlow
 import oauth2client.file
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import webbrowser
 
 
+def _logs_to_client(method):
+    """Wrap a client method to send DynamicClientLogger output to the client's logger."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with utils.client_logging(self.logger, self.log_budget):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
 class _Base(metaclass=utils.DocstringInheritMeta):
     """Factors out common client setup."""
     _session_class = utils.NotImplementedField
 
     num_clients = 0  # used to disambiguate loggers
 
-    def __init__(self, logger_basename, debug_logging, validate, verify_ssl):
+    # the size in bytes of the largest server response logged in full; None for no limit.
+    # larger responses are summarized without being formatted.
+    log_budget = None
+
+    # a gmusicapi.utils.responsecache.ResponseCache for calls that set cache_ttl.
+    response_cache = None
+
+    # the number of pages of library listings to retrieve in the background
+    # while the caller processes the current one; see utils.prefetch.
+    prefetch_pages = 0
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # static code called by public methods should log to the client's logger
+        for name, attr in list(vars(cls).items()):
+            if not name.startswith('_') and inspect.isfunction(attr):
+                setattr(cls, name, _logs_to_client(attr))
+
+    def __init__(self, logger_basename, debug_logging, validate, verify_ssl,
+                 pool_connections=10, pool_maxsize=10, timeout=None, max_retries=0):
         """
 
         :param debug_logging: each Client has a ``logger`` member.
@@ -34,6 +69,10 @@ class _Base(metaclass=utils.DocstringInheritMeta):
           If ``False``, no handlers will be configured;
           users must create their own handlers.
 
+          Server responses are logged at the debug level.
+          Set ``log_budget`` on the client to the size in bytes of the largest
+          response to log in full; larger responses will only be summarized.
+
           Completely ignoring logging is dangerous and not recommended.
           The Google Music protocol can change at any time; if
           something were to go wrong, the logs would be necessary for
@@ -41,7 +80,10 @@ class _Base(metaclass=utils.DocstringInheritMeta):
 
         :param validate: if False, do not validate server responses against
           known schemas. This helps to catch protocol changes, but requires
-          significant cpu work.
+          some cpu work.
+
+          A :class:`gmusicapi.utils.validation.ValidationPolicy` can be passed
+          to validate only a sample of responses and list items.
 
           This arg is stored as ``self.validate`` and can be safely
           modified at runtime.
@@ -50,6 +92,21 @@ class _Base(metaclass=utils.DocstringInheritMeta):
           are problems verifying SSL certificates.
           Be wary of using this option; it's almost always better to
           fix the machine's SSL configuration than to ignore errors.
+
+        :param pool_connections: the number of hosts to keep connection pools for.
+
+        :param pool_maxsize: the number of connections to keep open to each host.
+          Clients shared by many threads should raise this to about the number of threads.
+
+        :param timeout: seconds to wait for the server to connect or send data,
+          or a ``(connect timeout, read timeout)`` tuple.
+          ``None`` (the default) waits forever.
+
+        :param max_retries: the number of times to retry requests that fail to connect
+          or get a 429 or 5xx response, backing off exponentially
+          and respecting Retry-After headers.
+          Only idempotent requests are retried after being sent.
+          A ``urllib3.util.retry.Retry`` can be passed for full control.
         """
         # this isn't correct if init is called more than once, so we log the
         # client name below to avoid confusion for people reading logs
@@ -62,10 +119,22 @@ class _Base(metaclass=utils.DocstringInheritMeta):
         self.validate = validate
         self._verify_ssl = verify_ssl
 
+        retries = max_retries
+        if isinstance(max_retries, int) and max_retries > 0:
+            retries = Retry(total=max_retries, backoff_factor=0.5,
+                            status_forcelist=(429, 500, 502, 503, 504),
+                            raise_on_status=False)
+
         def setup_session(s):
             s.verify = self._verify_ssl
 
-        self.session = self._session_class(rsession_setup=setup_session)
+            adapter = HTTPAdapter(pool_connections=pool_connections,
+                                  pool_maxsize=pool_maxsize,
+                                  max_retries=retries)
+            s.mount('https://', adapter)
+            s.mount('http://', adapter)
+
+        self.session = self._session_class(rsession_setup=setup_session, timeout=timeout)
 
         if debug_logging:
             utils.configure_debug_log_handlers(self.logger)
@@ -80,7 +149,29 @@ class _Base(metaclass=utils.DocstringInheritMeta):
 
         CallFailure may be raised."""
 
-        return protocol.perform(self.session, self.validate, *args, **kwargs)
+        with utils.client_logging(self.logger, self.log_budget):
+            cache = self.response_cache
+            if cache is None or protocol.cache_ttl is None:
+                return protocol.perform(self.session, self.validate, *args, **kwargs)
+
+            build_kwargs = {k: v for (k, v) in kwargs.items() if k != 'required_auth'}
+            key = cache.make_key(protocol, self._response_cache_scope(),
+                                 protocol.build_request(*args, **build_kwargs))
+
+            res = cache.get(protocol, key)
+            if res is not None:
+                self.logger.debug("%s response retrieved from the response cache",
+                                  protocol.__name__)
+                return res
+
+            res = protocol.perform(self.session, self.validate, *args, **kwargs)
+            cache.put(protocol, key, res)
+
+            return res
+
+    def _response_cache_scope(self):
+        """Return session state that changes responses, for response cache keys."""
+        return None
 
     def is_authenticated(self):
         """Returns ``True`` if the Api can make an authenticated request."""
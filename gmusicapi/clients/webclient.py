@@ -32,7 +32,8 @@ class Webclient(_Base):
 
     _session_class = gmusicapi.session.Webclient
 
-    def __init__(self, debug_logging=True, validate=True, verify_ssl=True):
+    def __init__(self, debug_logging=True, validate=True, verify_ssl=True,
+                 pool_connections=10, pool_maxsize=10, timeout=None, max_retries=0):
         warnings.warn(
             "Webclient functionality is not tested nor well supported. "
             "Use Mobileclient or Musicmanager if possible.",
@@ -42,7 +43,11 @@ class Webclient(_Base):
         super().__init__(self.__class__.__name__,
                          debug_logging,
                          validate,
-                         verify_ssl)
+                         verify_ssl,
+                         pool_connections=pool_connections,
+                         pool_maxsize=pool_maxsize,
+                         timeout=timeout,
+                         max_retries=max_retries)
 
     def login(self, email, password):
         """Authenticates the webclient.
@@ -11,12 +11,17 @@ import hmac
 import time
 from uuid import uuid1
 
-import validictory
-
 import json
 from gmusicapi.exceptions import ValidationException, CallFailure
 from gmusicapi.protocol.shared import Call, authtypes
-from gmusicapi.utils import utils
+from gmusicapi.utils import utils, validation
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+log = utils.DynamicClientLogger(__name__)
 
 
 # URL for sj service
@@ -663,9 +668,11 @@ class McCall(Call):
 
     @classmethod
     def validate(cls, response, msg):
-        """Use validictory and a static schema (stored in cls._res_schema)."""
+        """Use a static validictory schema (stored in cls._res_schema).
+
+        The schema is compiled on first use; see :mod:`gmusicapi.utils.validation`."""
         try:
-            return validictory.validate(msg, cls._res_schema)
+            return validation.validate(msg, cls._res_schema)
         except ValueError as e:
             raise ValidationException(str(e)) from e
 
@@ -684,7 +691,7 @@ class McCall(Call):
 
     @classmethod
     def parse_response(cls, response):
-        return cls._parse_json(response.text)
+        return cls._parse_json(response.content)
 
 
 class McListCall(McCall):
@@ -693,6 +700,8 @@ class McListCall(McCall):
     item_schema = utils.NotImplementedField
     filter_text = utils.NotImplementedField
 
+    summarized_fields = (('data', 'items'),)
+
     static_headers = {'Content-Type': 'application/json'}
     static_params = {'alt': 'json', 'include-tracks': 'true'}
 
@@ -703,12 +712,100 @@ class McListCall(McCall):
             'kind': {'type': 'string'},
             'nextPageToken': {'type': 'string', 'required': False},
             'data': {'type': 'object',
-                     'items': {'type': 'array', 'items': item_schema},
+                     'properties': {'items': {'type': 'array'}},
                      'required': False,
                      },
         },
     }
 
+    @classmethod
+    def validate_sample(cls, response, msg, policy):
+        """Validate the envelope and the items sampled by *policy*.
+        Plain validate only checks the envelope, since pages can hold thousands of items."""
+        super().validate(response, msg)
+        cls._validate_items(policy.sample_items(cls._items(msg)))
+
+    @classmethod
+    def _items(cls, msg):
+        """Return the items of a response with a valid envelope."""
+        return msg['data']['items']
+
+    @classmethod
+    def _validate_items(cls, items):
+        try:
+            for item in items:
+                validation.validate(item, cls.item_schema)
+        except ValueError as e:
+            raise ValidationException(str(e)) from e
+
+    @classmethod
+    def streamed(cls):
+        """Return a version of this call that responds with the streamed requests.Response.
+        Its items can then be parsed one at a time with iter_items."""
+
+        if ijson is None:
+            raise ImportError("ijson must be installed to stream responses")
+
+        try:
+            return _streamed_calls[cls]
+        except KeyError:
+            streamed = type(cls.__name__, (_StreamedList, cls), {'__module__': cls.__module__})
+            return _streamed_calls.setdefault(cls, streamed)
+
+    @classmethod
+    def iter_items(cls, response, validate):
+        """Yield the items of a response to cls.streamed() as they're parsed.
+        Return its nextPageToken, or None if there isn't one; use ``yield from`` to get it.
+
+        :param validate: like the validate param of perform.
+          Items are only validated by a gmusicapi.utils.validation.ValidationPolicy,
+          up to its max_items.
+        """
+
+        max_items = 0
+        if isinstance(validate, validation.ValidationPolicy):
+            max_items = validate.max_items
+
+        item_prefix = 'data.items.item'
+        next_page_token = None
+        builder = None
+        num_items = 0
+
+        # the content isn't decoded automatically when read from raw
+        response.raw.decode_content = True
+
+        for prefix, event, value in ijson.parse(response.raw, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+
+                if prefix == item_prefix and event == 'end_map':
+                    item = builder.value
+                    builder = None
+
+                    if validate and (max_items is None or num_items < max_items):
+                        cls._validate_streamed_item(item)
+                    num_items += 1
+
+                    yield item
+
+            elif prefix == item_prefix and event == 'start_map':
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+
+            elif prefix == 'nextPageToken' and event == 'string':
+                next_page_token = value
+
+        return next_page_token
+
+    @classmethod
+    def _validate_streamed_item(cls, item):
+        """Log problems with an item, like perform does for whole responses."""
+        try:
+            cls._validate_items([item])
+        except ValidationException as e:
+            log.exception("the response format for %s was not recognized.\n\n%s\n",
+                          cls.__name__, e)
+
     @classmethod
     def dynamic_params(cls, updated_after=None, start_token=None, max_results=None):
         """
@@ -743,18 +840,37 @@ class McListCall(McCall):
     def parse_response(cls, response):
         # empty results don't include the data key
         # make sure it's always there
-        res = cls._parse_json(response.text)
+        res = cls._parse_json(response.content)
         if 'data' not in res:
             res['data'] = {'items': []}
 
         return res
 
+
+class _StreamedList(McCall):
+    """Mixed into list calls by McListCall.streamed."""
+
+    static_stream = True
+
+    @classmethod
+    def parse_response(cls, response):
+        return response
+
+    @classmethod
+    def validate(cls, response, msg):
+        pass  # items are validated as they're parsed
+
     @classmethod
-    def filter_response(cls, msg):
-        filtered = copy.deepcopy(msg)
-        filtered['data']['items'] = ["<%s %s>" % (len(filtered['data']['items']),
-                                                  cls.filter_text)]
-        return filtered
+    def validate_sample(cls, response, msg, policy):
+        pass
+
+    @staticmethod
+    def filter_response(res):
+        return "<streamed response: code %s>" % res.status_code
+
+
+# {McListCall subclass: its streamed version}
+_streamed_calls = {}
 
 
 class McBatchMutateCall(McCall):
@@ -1017,6 +1133,7 @@ class ListSharedPlaylistEntries(McListCall):
         },
     }
     filter_text = 'shared plentries'
+    summarized_fields = (('entries', 0, 'playlistEntry'),)
 
     static_method = 'POST'
     static_url = sj_url + 'plentries/shared'
@@ -1052,19 +1169,16 @@ class ListSharedPlaylistEntries(McListCall):
 
     @classmethod
     def parse_response(cls, response):
-        res = cls._parse_json(response.text)
+        res = cls._parse_json(response.content)
         if 'playlistEntry' not in res['entries'][0]:
             res['entries'][0]['playlistEntry'] = []
 
         return res
 
     @classmethod
-    def filter_response(cls, msg):
-        filtered = copy.deepcopy(msg)
-        filtered['entries'][0]['playlistEntry'] = ["<%s %s>" %
-                                                   (len(filtered['entries'][0]['playlistEntry']),
-                                                    cls.filter_text)]
-        return filtered
+    def validate_sample(cls, response, msg, policy):
+        # entries are part of the envelope here, so they're always validated
+        cls.validate(response, msg)
 
 
 class BatchMutatePlaylists(McBatchMutateCall):
@@ -1238,6 +1352,8 @@ class ListPromotedTracks(McListCall):
 
 
 class ListListenNowItems(McCall):
+    summarized_fields = (('listennow_items',),)
+
     static_method = 'GET'
     static_url = sj_url + "listennow/getlistennowitems"
     static_params = {'alt': 'json'}
@@ -1254,15 +1370,10 @@ class ListListenNowItems(McCall):
         }
     }
 
-    @staticmethod
-    def filter_response(msg):
-        filtered = copy.deepcopy(msg)
-        if 'listennow_items' in filtered:
-            filtered['listennow_items'] = \
-                    ["<%s listennow_items>" % len(filtered['listennow_items'])]
-
 
 class ListListenNowSituations(McCall):
+    summarized_fields = (('data', 'situations'),)
+
     static_method = 'POST'
     static_url = sj_url + 'listennow/situations'
     static_headers = {'Content-Type': 'application/json'}
@@ -1291,20 +1402,12 @@ class ListListenNowSituations(McCall):
             'requestSignals': {'timeZoneOffsetSecs': tz_offset}
         })
 
-    @staticmethod
-    def filter_response(msg):
-        filtered = copy.deepcopy(msg)
-        if 'situations' in filtered.get('data', {}):
-            filtered['data']['situations'] = \
-                    ["<%s situations>" % len(filtered['data']['situations'])]
-
-        return filtered
-
 
 class GetBrowsePodcastHierarchy(McCall):
     static_method = 'GET'
     static_url = sj_url + 'podcast/browsehierarchy'
     static_params = {'alt': 'json'}
+    cache_ttl = 24 * 60 * 60
 
     _res_schema = {
         'type': 'object',
@@ -1320,6 +1423,9 @@ class GetBrowsePodcastHierarchy(McCall):
 
 
 class ListBrowsePodcastSeries(McCall):
+    summarized_fields = (('series',),)
+    filter_text = 'podcasts'
+
     static_method = 'GET'
     static_url = sj_url + 'podcast/browse'
     static_params = {'alt': 'json'}
@@ -1339,13 +1445,6 @@ class ListBrowsePodcastSeries(McCall):
     def dynamic_params(cls, id=None):
         return {'id': id}
 
-    @staticmethod
-    def filter_response(msg):
-        filtered = copy.deepcopy(msg)
-        if 'series' in filtered:
-            filtered['series'] = \
-                    ["<%s podcasts>" % len(filtered['series'])]
-
 
 class BatchMutatePodcastSeries(McBatchMutateCall):
     static_method = 'POST'
@@ -1451,6 +1550,8 @@ class ListStations(McListCall):
 
 
 class ListStationTracks(McCall):
+    summarized_fields = (('data', 'stations'),)
+
     _res_schema = {
         'type': 'object',
         'additionalProperties': False,
@@ -1499,14 +1600,6 @@ class ListStationTracks(McCall):
                                }
                            ]})
 
-    @staticmethod
-    def filter_response(msg):
-        filtered = copy.deepcopy(msg)
-        if 'stations' in filtered.get('data', {}):
-            filtered['data']['stations'] = \
-                    ["<%s stations>" % len(filtered['data']['stations'])]
-        return filtered
-
 
 class BatchMutateStations(McBatchMutateCall):
     static_method = 'POST'
@@ -1604,6 +1697,7 @@ class GetPodcastSeries(McCall):
     static_url = sj_url + 'podcast/fetchseries'
     static_headers = {'Content-Type': 'application/json'}
     static_params = {'alt': 'json'}
+    cache_ttl = 60 * 60
 
     _res_schema = sj_podcast_series
 
@@ -1633,6 +1727,7 @@ class GetStoreTrack(McCall):
     static_url = sj_url + 'fetchtrack'
     static_headers = {'Content-Type': 'application/json'}
     static_params = {'alt': 'json'}
+    cache_ttl = 60 * 60
 
     _res_schema = sj_track
 
@@ -1645,6 +1740,7 @@ class GetGenres(McCall):
     static_method = 'GET'
     static_url = sj_url + 'explore/genres'
     static_params = {'alt': 'json'}
+    cache_ttl = 24 * 60 * 60
 
     _res_schema = {
         'type': 'object',
@@ -1668,6 +1764,7 @@ class GetArtist(McCall):
     static_method = 'GET'
     static_url = sj_url + 'fetchartist'
     static_params = {'alt': 'json'}
+    cache_ttl = 60 * 60
 
     _res_schema = sj_artist
 
@@ -1690,6 +1787,7 @@ class GetAlbum(McCall):
     static_method = 'GET'
     static_url = sj_url + 'fetchalbum'
     static_params = {'alt': 'json'}
+    cache_ttl = 60 * 60
 
     _res_schema = sj_album
 
@@ -3,14 +3,18 @@
 import base64
 import hashlib
 import itertools
+import mmap
 import os
 import shutil
+import struct
 from tempfile import NamedTemporaryFile
 
 import dateutil.parser
 from decorator import decorator
 from google.protobuf.message import DecodeError
 import mutagen
+from mutagen.id3 import BitPaddedInt, ParseID3v1
+import mutagen.mp3
 
 import json
 from gmusicapi.exceptions import CallFailure
@@ -23,6 +27,30 @@ log = utils.DynamicClientLogger(__name__)
 
 _android_url = 'https://android.clients.google.com/upsj/'
 
+# mutagen looks for an ID3v1 tag in this many bytes at the end of a file
+_ID3V1_SEARCH_SIZE = 128 + len(b'APE')
+
+
+def _find_id3v1_offset(data, end):
+    """Return the (negative) offset from *end* of an ID3v1 tag in *data*, or 0 if there isn't one.
+    This mirrors mutagen's search."""
+
+    tail = data[end - _ID3V1_SEARCH_SIZE:end]
+
+    idx = tail.find(b'TAG')
+    if idx == -1:
+        return 0
+
+    ape_idx = tail.find(b'APETAGEX')
+    if ape_idx != -1 and idx == ape_idx + len(b'APE'):
+        # this is part of an APEv2 footer
+        return 0
+
+    if ParseID3v1(tail[idx:]) is None:
+        return 0
+
+    return idx - len(tail)
+
 
 @decorator
 def pb(f, *args, **kwargs):
@@ -124,6 +152,16 @@ class UploadMetadata(MmCall):
         # converting sum to base64
         # removing trailing ===
 
+        m = UploadMetadata._md5_stripped_mp3(filepath)
+        if m is None:
+            m = UploadMetadata._md5_stripped_copy(filepath)
+
+        return base64.encodebytes(m.digest())[:-3]
+
+    @staticmethod
+    def _md5_stripped_copy(filepath):
+        """Return the md5 of a copy of the file with its tags stripped by mutagen."""
+
         m = hashlib.md5()
 
         try:
@@ -149,7 +187,54 @@ class UploadMetadata(MmCall):
             except OSError:
                 log.exception("Could not remove temporary file %r", temp.name)
 
-        return base64.encodestring(m.digest())[:-3]
+        return m
+
+    @staticmethod
+    def _md5_stripped_mp3(filepath):
+        """Return the same md5 as _md5_stripped_copy without copying the file,
+        or None if the file isn't a simply-tagged mp3.
+
+        The result of mutagen's delete then save on a tagged mp3 is
+        an empty ID3v2.4 tag with default padding, followed by the audio between
+        the original ID3v2 tag and ID3v1 tag. This hashes that directly."""
+
+        audio = mutagen.File(filepath, easy=True)
+        if not isinstance(audio, mutagen.mp3.EasyMP3):
+            return None
+
+        m = hashlib.md5()
+
+        with open(filepath, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _ID3V1_SEARCH_SIZE + 10:
+                return None  # mutagen handles tiny files specially
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data, \
+                    memoryview(data) as view:
+                if audio.tags is None:
+                    # save and delete don't touch untagged files
+                    m.update(view)
+                    return m
+
+                start, end = 0, size + _find_id3v1_offset(data, size)
+
+                id3, insize = struct.unpack('>3s3x4s', data[:10])
+                if id3 == b'ID3':
+                    start = 10 + BitPaddedInt(insize)
+
+                if (end - start < _ID3V1_SEARCH_SIZE or
+                        data[start:start + 3] == b'ID3' or
+                        _find_id3v1_offset(data, end) != 0):
+                    # multiple tags; mutagen would only strip one of each
+                    return None
+
+                padding = 1024 + (end - start) // 1000
+                m.update(struct.pack('>3sBBB4s', b'ID3', 4, 0, 0,
+                                     BitPaddedInt.to_str(padding, width=4)))
+                m.update(b'\x00' * padding)
+                m.update(view[start:end])
+
+        return m
 
     # these collections define how locker_pb2.Track fields align to mutagen's.
     shared_fields = ('album', 'artist', 'composer', 'genre')
@@ -351,7 +436,7 @@ class GetUploadSession(MmCall):
 
     @classmethod
     def parse_response(cls, response):
-        return cls._parse_json(response.text)
+        return cls._parse_json(response.content)
 
     @staticmethod
     def filter_response(res):
@@ -465,7 +550,7 @@ class UploadFile(MmCall):
 
     @classmethod
     def parse_response(cls, response):
-        return cls._parse_json(response.text)
+        return cls._parse_json(response.content)
 
     @staticmethod
     def filter_response(res):
@@ -482,6 +567,11 @@ class UploadFile(MmCall):
 
     @staticmethod
     def dynamic_data(session_url, content_type, audio):
+        """
+        :param audio: a bytestring, a binary file object, or an iterable of bytestrings.
+          File objects are sent with a known length; iterables are sent chunked.
+          Neither are read into memory up front.
+        """
         return audio
 
 
@@ -681,7 +771,7 @@ class GetDownloadLink(MmCall):
 
     @classmethod
     def parse_response(cls, response):
-        return cls._parse_json(response.text)
+        return cls._parse_json(response.content)
 
     @staticmethod
     def filter_response(res):
@@ -692,24 +782,36 @@ class DownloadTrack(MmCall):
     """Given a url, retrieve a track. Unlike the Webclient, this
     requires authentication.
 
-    The entire Requests.Response is returned."""
+    The entire Requests.Response is returned.
+    Its body is streamed, so the caller must consume or close it."""
 
     static_method = 'GET'
+    static_stream = True
 
     @staticmethod
-    def dynamic_url(url):
+    def dynamic_url(url, range_start=None):
         """
         :param url: result of a call to GetDownloadLink
+        :param range_start: (optional) the byte offset to start the download from.
+          The server responds with a 206 when it honors this.
         """
         return url
 
+    @staticmethod
+    def dynamic_headers(url, range_start=None):
+        if range_start is None:
+            return {}
+
+        return {'Range': 'bytes=%s-' % range_start}
+
     @classmethod
     def parse_response(cls, response):
         return response
 
     @staticmethod
     def filter_response(res):
-        return "code: %s; size: %s bytes; disposition: %r" % (
+        return "code: %s; size: %s bytes; range: %s; disposition: %r" % (
             res.status_code,
-            res.headers['Content-Length'],
-            res.headers['Content-Disposition'])
+            res.headers.get('Content-Length'),
+            res.headers.get('Content-Range'),
+            res.headers.get('Content-Disposition'))
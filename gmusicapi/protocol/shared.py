@@ -1,14 +1,15 @@
 """Definitions shared by multiple clients."""
 
 from collections import namedtuple
+import copy
+import logging
 
 from google.protobuf.descriptor import FieldDescriptor
 
-import json
 from gmusicapi.exceptions import (
     CallFailure, ParseException, ValidationException,
 )
-from gmusicapi.utils import utils
+from gmusicapi.utils import utils, validation
 
 import requests
 
@@ -43,7 +44,8 @@ class BuildRequestMeta(type):
         new_cls = super().__new__(cls, name, bases, dct)
 
         merge_keys = ('headers', 'params')
-        all_keys = ('method', 'url', 'files', 'data', 'verify', 'allow_redirects') + merge_keys
+        all_keys = ('method', 'url', 'files', 'data', 'verify', 'allow_redirects',
+                    'stream') + merge_keys
 
         config = {}  # stores key: val for static or f(*args, **kwargs) -> val for dyn
         dyn = lambda key: 'dynamic_' + key  # noqa
@@ -67,8 +69,10 @@ class BuildRequestMeta(type):
                     def build_key(*args, **kwargs):
                         dyn_val = dyn_func(*args, **kwargs)
 
-                        stat_val.update(dyn_val)
-                        return stat_val
+                        # copy, since the static val is shared between requests
+                        merged = stat_val.copy()
+                        merged.update(dyn_val)
+                        return merged
                     return build_key
                 config[key] = key_closure()
 
@@ -82,6 +86,9 @@ class BuildRequestMeta(type):
                 for key, val in config.items():
                     if hasattr(val, '__call__'):
                         val = val(*args, **kwargs)
+                    elif key in merge_keys:
+                        # sessions add to these, so don't hand out the shared static val
+                        val = val.copy()
 
                     req_kwargs[key] = val
 
@@ -142,12 +149,24 @@ class Call(metaclass=BuildRequestMeta):
     Calls must define parse_response.
     Calls can also define filter_response, validate and check_success.
 
+    Large lists in responses can be logged as a "<N items>" placeholder by listing
+    their paths in summarized_fields, eg ``summarized_fields = (('data', 'items'),)``.
+    Placeholders use filter_text if it's set, otherwise the last key of the path.
+
+    Calls for data that rarely changes can set cache_ttl to the number of seconds
+    their responses can be kept by a client's response_cache.
+
     Calls are organized semantically, so one endpoint might have multiple calls.
     """
 
     gets_logged = True
     fail_on_non_200 = True
 
+    summarized_fields = ()
+    filter_text = None
+
+    cache_ttl = None
+
     required_auth = authtypes()  # all false by default
 
     @classmethod
@@ -164,6 +183,16 @@ class Call(metaclass=BuildRequestMeta):
         """
         pass
 
+    @classmethod
+    def validate_sample(cls, response, msg, policy):
+        """Like validate, but only validate the parts of msg that *policy* samples.
+
+        Calls with large responses override this; the default validates everything.
+
+        :param policy: a gmusicapi.utils.validation.ValidationPolicy
+        """
+        cls.validate(response, msg)
+
     @classmethod
     def check_success(cls, response, msg):
         """Raise CallFailure on problems.
@@ -176,7 +205,10 @@ class Call(metaclass=BuildRequestMeta):
     @classmethod
     def filter_response(cls, msg):
         """Return a version of a parsed response appropriate for logging."""
-        return msg  # default to identity
+        for path in cls.summarized_fields:
+            msg = cls._summarize(msg, path, cls.filter_text or path[-1])
+
+        return msg
 
     @classmethod
     def perform(cls, session, validate, *args, **kwargs):
@@ -185,31 +217,65 @@ class Call(metaclass=BuildRequestMeta):
 
         :param session: a PlaySession used to send this request.
         :param validate: if False, do not validate.
+          A gmusicapi.utils.validation.ValidationPolicy decides how much to validate.
         :param required_auth: if in kwargs, overrides the static protocol required_auth.
         """
         # TODO link up these docs
 
+        req_kwargs, required_auth = cls._prepare_request(*args, **kwargs)
+
+        response = session.send(req_kwargs, required_auth)
+
+        return cls._handle_response(response, req_kwargs, validate)
+
+    @classmethod
+    async def perform_async(cls, send, validate, *args, **kwargs):
+        """Like perform, but for use from a coroutine.
+
+        :param send: a coroutine function taking ``(req_kwargs, required_auth)``
+          that sends the request and returns a requests.Response with its content read.
+        """
+
+        req_kwargs, required_auth = cls._prepare_request(*args, **kwargs)
+
+        response = await send(req_kwargs, required_auth)
+
+        return cls._handle_response(response, req_kwargs, validate)
+
+    @classmethod
+    def _prepare_request(cls, *args, **kwargs):
+        """Log and build a request for perform.
+        Return (requests kwargs, required_auth)."""
+
         call_name = cls.__name__
 
-        if cls.gets_logged:
-            log.debug("%s(args=%s, kwargs=%s)",
-                      call_name,
-                      [utils.truncate(a) for a in args],
-                      {k: utils.truncate(v) for (k, v) in kwargs.items()}
-                      )
-        else:
-            log.debug("%s(<omitted>)", call_name)
+        # formatting requests and responses is expensive, so only do it when it'll be logged
+        if log.isEnabledFor(logging.DEBUG):
+            if cls.gets_logged:
+                log.debug("%s(args=%s, kwargs=%s)",
+                          call_name,
+                          [utils.truncate(a) for a in args],
+                          {k: utils.truncate(v) for (k, v) in kwargs.items()}
+                          )
+            else:
+                log.debug("%s(<omitted>)", call_name)
 
         required_auth = kwargs.pop('required_auth', cls.required_auth)
 
-        req_kwargs = cls.build_request(*args, **kwargs)
+        return cls.build_request(*args, **kwargs), required_auth
 
-        response = session.send(req_kwargs, required_auth)
-        # TODO trim the logged response if it's huge?
+    @classmethod
+    def _handle_response(cls, response, req_kwargs, validate):
+        """Check, parse and validate the response to a request made by perform.
+        Return the parsed response."""
+
+        call_name = cls.__name__
+        log_debug = log.isEnabledFor(logging.DEBUG)
 
         safe_req_kwargs = req_kwargs.copy()
         if safe_req_kwargs.get('headers', {}).get('Authorization', None) is not None:
-            safe_req_kwargs['headers']['Authorization'] = '<omitted>'
+            safe_req_kwargs['headers'] = dict(safe_req_kwargs['headers'],
+                                              Authorization='<omitted>')
 
         if cls.fail_on_non_200:
             try:
@@ -237,13 +303,15 @@ class Call(metaclass=BuildRequestMeta):
 
             raise CallFailure(err_msg, call_name)
 
-        if cls.gets_logged:
-            log.debug(cls.filter_response(parsed_response))
+        if cls.gets_logged and log_debug:
+            cls._log_response(response, parsed_response, req_kwargs.get('stream', False))
 
         try:
             # order is important; validate only has a schema for a successful response
             cls.check_success(response, parsed_response)
-            if validate:
+            if isinstance(validate, validation.ValidationPolicy):
+                validate.validate(cls, response, parsed_response)
+            elif validate:
                 cls.validate(response, parsed_response)
         except CallFailure as e:
             if not cls.gets_logged:
@@ -280,13 +348,52 @@ class Call(metaclass=BuildRequestMeta):
 
         return parsed_response
 
+    @classmethod
+    def _log_response(cls, response, msg, streamed):
+        """Log a filtered response, or only its size if it's over the client's log budget."""
+
+        budget = utils.log_budget()
+
+        # the content of streamed responses hasn't been read
+        if budget is not None and not streamed and len(response.content) > budget:
+            log.debug("<%s response: %s bytes; over the log budget of %s bytes>",
+                      cls.__name__, len(response.content), budget)
+        else:
+            log.debug(cls.filter_response(msg))
+
     @staticmethod
     def _parse_json(text):
+        """Parse a str, or utf-8 bytes like ``response.content``, with
+        the json backend chosen by utils.set_json_backend."""
         try:
-            return json.loads(text)
+            return utils.json_loads(text)
         except ValueError as e:
             raise ParseException(str(e)) from e
 
+    @staticmethod
+    def _summarize(msg, path, text):
+        """Return msg with the list at path replaced by a "<N text>" placeholder.
+
+        Only the containers along path are copied; msg is unchanged.
+        msg is returned as-is if path isn't in it."""
+
+        key = path[0]
+        try:
+            value = msg[key]
+        except (KeyError, IndexError, TypeError):
+            return msg
+
+        if len(path) == 1:
+            summary = ["<%s %s>" % (len(value), text)]
+        else:
+            summary = Call._summarize(value, path[1:], text)
+            if summary is value:
+                return msg
+
+        filtered = copy.copy(msg)
+        filtered[key] = summary
+        return filtered
+
     @staticmethod
     def _filter_proto(msg, make_copy=True):
         """Filter all byte fields in the message and submessages."""
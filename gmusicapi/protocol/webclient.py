@@ -10,12 +10,10 @@ import random
 import string
 from hashlib import sha1
 
-import validictory
-
 import json
 from gmusicapi.exceptions import CallFailure, ValidationException
 from gmusicapi.protocol.shared import Call, authtypes
-from gmusicapi.utils import utils, jsarray
+from gmusicapi.utils import utils, jsarray, validation
 
 base_url = 'https://play.google.com/music/'
 service_url = base_url + 'services/'
@@ -60,9 +58,11 @@ class WcCall(Call):
 
     @classmethod
     def validate(cls, response, msg):
-        """Use validictory and a static schema (stored in cls._res_schema)."""
+        """Use a static validictory schema (stored in cls._res_schema).
+
+        The schema is compiled on first use; see :mod:`gmusicapi.utils.validation`."""
         try:
-            return validictory.validate(msg, cls._res_schema)
+            return validation.validate(msg, cls._res_schema)
         except ValueError as e:
             raise ValidationException(str(e)) from e
 
@@ -82,7 +82,7 @@ class WcCall(Call):
 
     @classmethod
     def parse_response(cls, response):
-        return cls._parse_json(response.text)
+        return cls._parse_json(response.content)
 
 
 class CreatePlaylist(WcCall):
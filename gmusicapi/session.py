@@ -3,8 +3,10 @@ Sessions handle the details of authentication and transporting requests.
 """
 
 from collections import namedtuple
-from contextlib import closing
+import datetime
+import http.cookiejar
 import json
+import threading
 
 import gpsoauth
 import httplib2  # included with oauth2client
@@ -48,12 +50,102 @@ def credentials_from_refresh_token(token, oauth_info):
     return OAuth2Credentials.new_from_json(json.dumps(cred_json))
 
 
+def _anonymous_rsession():
+    """Return a requests.Session that never stores or sends cookies."""
+
+    rsession = requests.Session()
+    rsession.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+
+    return rsession
+
+
+class _OAuthTokens:
+    """Provides fresh access tokens from oauth2client credentials to concurrent requests.
+
+    Only one refresh runs at a time; requests that find the token expired wait for it.
+    Tokens that expire within refresh_margin are refreshed by a background thread
+    while requests continue to use them.
+    """
+
+    refresh_margin = datetime.timedelta(minutes=5)
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+
+        self._refresh_lock = threading.Lock()
+        self._background_lock = threading.Lock()
+        self._background = None
+
+        # reused so refreshes can keep a connection to the token endpoint.
+        # only used under _refresh_lock, since it isn't thread-safe.
+        self._http = httplib2.Http()
+
+    def access_token(self):
+        """Return a valid access token, refreshing first if needed."""
+
+        creds = self.credentials
+
+        if creds.access_token_expired:
+            self.refresh(only_if_expired=True)
+            return creds.access_token
+
+        token = creds.access_token
+        if self._expires_soon():
+            self._refresh_in_background()
+
+        return token
+
+    def refresh(self, only_if_expired=False):
+        """Refresh the access token.
+
+        :param only_if_expired: skip the refresh if the token isn't expired
+          (eg because another thread refreshed it while this one waited).
+        """
+
+        with self._refresh_lock:
+            if only_if_expired and not self.credentials.access_token_expired:
+                return
+
+            self.credentials.refresh(self._http)
+
+    def _expires_soon(self):
+        expiry = self.credentials.token_expiry
+        return (expiry is not None and
+                expiry - datetime.datetime.utcnow() < self.refresh_margin)
+
+    def _refresh_in_background(self):
+        with self._background_lock:
+            if self._background is not None and self._background.is_alive():
+                return
+
+            self._background = threading.Thread(target=self._background_refresh,
+                                                name='gmusicapi-token-refresh', daemon=True)
+            self._background.start()
+
+    def _background_refresh(self):
+        with self._refresh_lock:
+            if not self._expires_soon():
+                return  # refreshed while this thread started
+
+            try:
+                self.credentials.refresh(self._http)
+            except Exception as e:
+                # requests will refresh (and raise) once the token expires
+                log.info("could not refresh oauth token in the background: %r", e)
+
+
 class _Base:
-    def __init__(self, rsession_setup=None):
+    def __init__(self, rsession_setup=None, timeout=None):
         """
         :param rsession_setup: a callable that will be called with
-          the backing requests.Session to delegate config to callers.
+          the backing requests.Sessions to delegate config to callers,
+          eg to mount adapters with larger connection pools.
+        :param timeout: the default requests timeout of sent requests.
         """
+        self.timeout = timeout
+
+        # sessions are shared by threads; this guards swapping and refreshing state
+        self._lock = threading.RLock()
         self._rsession = requests.Session()
 
         if rsession_setup is None:
@@ -61,11 +153,20 @@ class _Base:
         self._rsession_setup = rsession_setup
         self._rsession_setup(self._rsession)
 
+        # unauthenticated requests reuse connections, but can't pick up or send cookies
+        self._anon_rsession = _anonymous_rsession()
+        self._rsession_setup(self._anon_rsession)
+
         self.is_authenticated = False
 
     def _send_with_auth(self, req_kwargs, desired_auth, rsession):
         raise NotImplementedError
 
+    def _authorize(self, req_kwargs, desired_auth):
+        """Add auth to requests kwargs that don't depend on a requests.Session.
+        Return the updated req_kwargs."""
+        raise NotImplementedError
+
     def _send_without_auth(self, req_kwargs, rsession):
         return rsession.request(**req_kwargs)
 
@@ -78,12 +179,15 @@ class _Base:
         """
         Reset the session to an unauthenticated, default state.
         """
-        self._rsession.close()
+        rsession = requests.Session()
+        self._rsession_setup(rsession)
 
-        self._rsession = requests.Session()
-        self._rsession_setup(self._rsession)
+        with self._lock:
+            old_rsession, self._rsession = self._rsession, rsession
+            self.is_authenticated = False
 
-        self.is_authenticated = False
+        # requests in flight keep the connections they're using
+        old_rsession.close()
 
     def send(self, req_kwargs, desired_auth, rsession=None):
         """Send a request from a Call using this session's auth.
@@ -95,14 +199,15 @@ class _Base:
         """
         res = None
 
+        if self.timeout is not None and 'timeout' not in req_kwargs:
+            req_kwargs = dict(req_kwargs, timeout=self.timeout)
+
         if not any(desired_auth):
             if rsession is None:
-                # use a throwaway session to ensure it's clean
-                with closing(requests.Session()) as new_session:
-                    self._rsession_setup(new_session)
-                    res = self._send_without_auth(req_kwargs, new_session)
-            else:
-                res = self._send_without_auth(req_kwargs, rsession)
+                # don't use the normal session; it might attach auth cookies
+                rsession = self._anon_rsession
+
+            res = self._send_without_auth(req_kwargs, rsession)
 
         else:
             if not self.is_authenticated:
@@ -205,14 +310,17 @@ class Musicmanager(_Base):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._oauth_creds = None
+        self._oauth_tokens = None
 
     def login(self, oauth_credentials, *args, **kwargs):
         """Store an already-acquired oauth2client.Credentials."""
         super().login()
 
+        tokens = _OAuthTokens(oauth_credentials)
+
         try:
             # refresh the token right away to check auth validity
-            oauth_credentials.refresh(httplib2.Http())
+            tokens.refresh()
         except oauth2client.client.Error:
             log.exception("error when refreshing oauth credentials")
 
@@ -220,21 +328,23 @@ class Musicmanager(_Base):
             log.info("could not refresh oauth credentials")
             return False
 
-        self._oauth_creds = oauth_credentials
-        self.is_authenticated = True
+        with self._lock:
+            self._oauth_creds = oauth_credentials
+            self._oauth_tokens = tokens
+            self.is_authenticated = True
 
         return self.is_authenticated
 
     def _send_with_auth(self, req_kwargs, desired_auth, rsession):
-        if desired_auth.oauth:
-            if self._oauth_creds.access_token_expired:
-                self._oauth_creds.refresh(httplib2.Http())
+        return rsession.request(**self._authorize(req_kwargs, desired_auth))
 
+    def _authorize(self, req_kwargs, desired_auth):
+        if desired_auth.oauth:
             req_kwargs['headers'] = req_kwargs.get('headers', {})
             req_kwargs['headers']['Authorization'] = \
-                'Bearer ' + self._oauth_creds.access_token
+                'Bearer ' + self._oauth_tokens.access_token()
 
-        return rsession.request(**req_kwargs)
+        return req_kwargs
 
 
 class Mobileclient(Musicmanager):
@@ -281,7 +391,7 @@ class Mobileclient(Musicmanager):
 
         return True
 
-    def _send_with_auth(self, req_kwargs, desired_auth, rsession):
+    def _authorize(self, req_kwargs, desired_auth):
         # Default to English (United States) if no locale given.
         if not self._locale:
             self._locale = 'en_US'
@@ -306,9 +416,9 @@ class Mobileclient(Musicmanager):
             # does this expire?
             req_kwargs['headers']['Authorization'] = \
                 'GoogleLogin auth=' + self._authtoken
-            return rsession.request(**req_kwargs)
+            return req_kwargs
 
         if desired_auth.oauth:
-            return super()._send_with_auth(req_kwargs, desired_auth, rsession)
+            return super()._authorize(req_kwargs, desired_auth)
 
-        raise ValueError("_send_with_auth got invalid desired_auth: {}".format(desired_auth))
+        raise ValueError("_authorize got invalid desired_auth: {}".format(desired_auth))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""A script that compares json backends on Mobileclient list responses.
+
+Usage: benchmark_json.py [recorded_response.json ...]
+
+Recorded responses (eg the bodies of ListTracks or ListPlaylistEntries
+responses saved from a debug session) are used if given.
+Otherwise, payloads shaped like full pages of those calls are generated.
+"""
+
+import importlib
+import json
+import sys
+import timeit
+
+from gmusicapi.protocol.shared import Call
+from gmusicapi.utils import utils
+
+
+def track(i):
+    return {
+        'kind': 'sj#track',
+        'id': '%08x-0000-4000-8000-%012x' % (i, i),
+        'clientId': 'Wz4QRJXVWWNT+a4eSgpt3w%06d' % i,
+        'creationTimestamp': str(1373000000000000 + i),
+        'lastModifiedTimestamp': str(1373000000000000 + i * 7),
+        'recentTimestamp': str(1373000000000000 + i * 3),
+        'deleted': False,
+        'title': 'Song title number %d' % i,
+        'artist': 'Some Artist é %d' % (i % 300),
+        'composer': '',
+        'album': 'An Album %d' % (i % 1500),
+        'albumArtist': 'Some Artist é %d' % (i % 300),
+        'year': 1990 + i % 30,
+        'comment': '',
+        'trackNumber': i % 14 + 1,
+        'genre': 'Rock',
+        'durationMillis': str(180000 + i % 120000),
+        'beatsPerMinute': 0,
+        'albumArtRef': [{'url': 'http://lh3.googleusercontent.com/%dabcdefghijklmnop' % i}],
+        'artistArtRef': [{'url': 'http://lh4.googleusercontent.com/%dqrstuvwxyz' % i}],
+        'playCount': i % 50,
+        'discNumber': 1,
+        'totalDiscCount': 1,
+        'totalTrackCount': 14,
+        'estimatedSize': str(4000000 + i),
+        'trackType': '8',
+        'storeId': 'T%026d' % i,
+        'albumId': 'B%026d' % (i % 1500),
+        'artistId': ['A%026d' % (i % 300)],
+        'nid': 'T%026d' % i,
+        'rating': '5',
+        'explicitType': '2',
+    }
+
+
+def playlist_entry(i):
+    return {
+        'kind': 'sj#playlistEntry',
+        'id': '%08x-1111-4000-8000-%012x' % (i, i),
+        'clientId': '%08x-2222-4000-8000-%012x' % (i, i),
+        'playlistId': '%08x-3333-4000-8000-%012x' % (i % 200, i % 200),
+        'absolutePosition': '%019d' % (i * 1000),
+        'trackId': '%08x-0000-4000-8000-%012x' % (i, i),
+        'creationTimestamp': str(1373000000000000 + i),
+        'lastModifiedTimestamp': str(1373000000000000 + i * 7),
+        'deleted': False,
+        'source': '1',
+    }
+
+
+def page(kind, items):
+    return json.dumps({'kind': kind, 'nextPageToken': 'KmMKXQoB', 'data': {'items': items}},
+                      indent=1).encode('utf-8')
+
+
+def main(paths):
+    if paths:
+        payloads = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                payloads.append((path, f.read()))
+    else:
+        # 20000 is the largest page the server will send
+        payloads = [
+            ('ListTracks, 20000 items', page('sj#trackList', [track(i) for i in range(20000)])),
+            ('ListPlaylistEntries, 20000 items',
+             page('sj#playlistEntryList', [playlist_entry(i) for i in range(20000)])),
+        ]
+
+    backends = []
+    for name in utils.json_backends:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            print('(%s is not installed)' % name)
+        else:
+            backends.append(name)
+
+    for description, content in payloads:
+        print('\n%s: %.1f MB' % (description, len(content) / 1e6))
+
+        # the previous behavior: decode response.text, then parse with the stdlib
+        baseline = min(timeit.repeat(lambda: json.loads(content.decode('utf-8')),
+                                     number=1, repeat=5))
+        print('  %-32s %7.1f ms' % ('json.loads(response.text)', baseline * 1000))
+
+        for name in backends:
+            utils.set_json_backend(name)
+            elapsed = min(timeit.repeat(lambda: Call._parse_json(content), number=1, repeat=5))
+            print('  %-32s %7.1f ms  (%.1fx)' % ('%s (response.content)' % name,
+                                                 elapsed * 1000, baseline / elapsed))
+
+    utils.set_json_backend()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
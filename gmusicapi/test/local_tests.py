@@ -2,33 +2,65 @@
 Tests that don't hit the Google Music servers.
 """
 
-from collections import namedtuple
+import asyncio
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import datetime
+import email
+import gzip
+from functools import partial
+import hashlib
+import http.server
+import io
+import itertools
+import json
+import logging
 import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
 import time
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, PropertyMock, patch
+import urllib.request
 
+from mutagen.apev2 import APEv2
+from mutagen.id3 import ID3, APIC, TIT2
 from proboscis.asserts import (
     assert_raises, assert_true, assert_false, assert_equal,
     assert_is_not, Check
 )
-from proboscis import test
+from proboscis import test, SkipTest
+import requests
+from requests.structures import CaseInsensitiveDict
+import validictory
 
 import gmusicapi.session
-from gmusicapi.clients import Mobileclient, Musicmanager
-from gmusicapi.exceptions import AlreadyLoggedIn
-from gmusicapi.protocol.shared import authtypes
-from gmusicapi.protocol import mobileclient
-from gmusicapi.utils import utils, jsarray
+from gmusicapi.clients import Mobileclient, Musicmanager, aio
+from gmusicapi.clients.musicmanager import _gather_track_info, _map_concurrently
+from gmusicapi.exceptions import (
+    AlreadyLoggedIn, CallFailure, NotLoggedIn, ParseException, ValidationException
+)
+from gmusicapi.protocol.shared import Call, authtypes
+from gmusicapi.protocol import locker_pb2, mobileclient, musicmanager, upload_pb2
+from gmusicapi.utils import utils, columnar, jsarray, records, validation
+from gmusicapi.utils.library import LibraryStore
+from gmusicapi.utils.responsecache import ResponseCache
+from gmusicapi.utils.trackcache import TrackInfoCache
 
 jsarray_samples = []
 jsarray_filenames = [base + '.jsarray' for base in ('searchresult', 'fetchartist')]
 
 test_file_dir = os.path.dirname(os.path.abspath(__file__))
+test_mp3_path = os.path.join(test_file_dir, 'audiotest_small.mp3')
 for filepath in [os.path.join(test_file_dir, p) for p in jsarray_filenames]:
     with open(filepath, 'r', encoding="utf-8") as f:
         jsarray_samples.append(f.read())
 
-# TODO test gather_local, transcoding
+# TODO test gather_local, transcoding with a real transcoder
 
 # All tests end up in the local group.
 test = test(groups=['local'])
@@ -64,6 +96,337 @@ def create_clients():
     return Clients(*clients)
 
 
+@test
+def mc_library_store_applies_deltas():
+    mc = create_clients().mobileclient
+    mc.library_store = LibraryStore(':memory:')
+
+    def page(*items):
+        return {'kind': 'sj#trackList', 'data': {'items': list(items)}}
+
+    def track(id, timestamp, deleted=False):
+        return {'id': id, 'lastModifiedTimestamp': str(timestamp), 'deleted': deleted}
+
+    mc._make_call = MagicMock(return_value=page(track('a', 10), track('b', 20)))
+    assert_equal([t['id'] for t in mc.get_all_songs()], ['a', 'b'])
+    assert_equal(mc._make_call.call_args[1]['updated_after'], None)
+
+    mc._make_call = MagicMock(return_value=page(track('a', 30, deleted=True), track('c', 40)))
+    assert_equal([t['id'] for t in mc.get_all_songs()], ['b', 'c'])
+    assert_equal(mc._make_call.call_args[1]['updated_after'],
+                 utils.microseconds_to_datetime(20))
+
+    # incremental calls and other kinds don't touch the store
+    mc._make_call = MagicMock(return_value=page(track('d', 50)))
+    assert_equal(list(mc.get_all_songs(incremental=True)), [[track('d', 50)]])
+    assert_equal(mc.library_store.get_items('ListTracks'), [track('b', 20), track('c', 40)])
+    assert_equal(mc.library_store.get_updated_min('ListPlaylists'), None)
+
+    # changed items keep their place
+    mc._make_call = MagicMock(return_value=page(track('b', 60), track('e', 70)))
+    assert_equal([t['id'] for t in mc.get_all_songs()], ['b', 'c', 'e'])
+    assert_equal(mc.get_all_songs()[0], track('b', 60))
+
+    # the store can be used while pages are retrieved
+    def pages():
+        with ThreadPoolExecutor(1) as executor:
+            yield executor.submit(mc.library_store.get_items, 'ListTracks').result(timeout=5)
+
+    mc.library_store.sync('ListTracks', pages())
+
+
+@test
+def mc_info_many_dedupes_and_keeps_order():
+    mc = create_clients().mobileclient
+    failure = CallFailure('not found', 'GetAlbum')
+
+    def make_call(call, album_id, include_tracks):
+        time.sleep(.01)
+        if album_id == 'Bbad':
+            raise failure
+        return {'albumId': album_id, 'tracks': include_tracks}
+
+    mc._make_call = MagicMock(side_effect=make_call)
+    album_ids = ['B%s' % (i % 7) for i in range(30)] + ['Bbad', 'B1']
+
+    results = mc.get_album_info_many(album_ids, include_tracks=False, workers=4)
+
+    assert_equal([r[0] for r in results], album_ids)
+    assert_equal(results[-1], ('B1', {'albumId': 'B1', 'tracks': False}, None))
+    assert_equal(results[-2], ('Bbad', None, failure))
+    assert_equal(mc._make_call.call_count, 8)
+
+    read = []
+
+    def read_ids():
+        for album_id in album_ids:
+            read.append(album_id)
+            yield album_id
+
+    # ids are only read a window ahead of the caller
+    generator = mc.get_album_info_many(read_ids(), workers=2, incremental=True)
+    assert_equal(next(generator)[:2], ('B0', {'albumId': 'B0', 'tracks': True}))
+    assert_equal(len(read), 4)
+    generator.close()
+
+    # repeats are retrieved once, even when they're far apart
+    mc._make_call.reset_mock()
+    album_ids = ['B%s' % (i % 50) for i in range(1000)]
+    results = mc.get_album_info_many(album_ids, workers=4)
+    assert_equal([r[1]['albumId'] for r in results], album_ids)
+    assert_equal(mc._make_call.call_count, 50)
+
+    assert_raises(ValueError, mc.get_track_info_many, [{'id': 'T1'}])
+
+
+@test
+def response_cache_serves_repeated_calls():
+    mc = create_clients().mobileclient
+    mc.validate = False
+    mc.session.send.side_effect = lambda req_kwargs, auth: MagicMock(
+        content=json.dumps({'nid': req_kwargs['params'].get('nid')}).encode('utf-8'))
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(temp_dir, 'responses.db')
+        mc.response_cache = ResponseCache(max_entries=1, filepath=db_path)
+
+        for track_id in ('T1', 'T1', 'T2', 'T1'):
+            assert_equal(mc.get_track_info(track_id), {'nid': track_id})
+
+        # T1 was evicted from memory by T2, but was still on disk
+        assert_equal(mc.session.send.call_count, 2)
+        assert_equal(mc.response_cache.stats, {'GetStoreTrack': Counter(hits=2, misses=2)})
+
+        # responses are copies, and calls without a ttl aren't cached
+        mc.get_track_info('T1')['nid'] = 'changed'
+        assert_equal(mc.get_track_info('T1'), {'nid': 'T1'})
+        mc._make_call(mobileclient.ListPlaylists)
+        assert_equal(mc.session.send.call_count, 3)
+
+        mc.response_cache.close()
+        mc.response_cache = ResponseCache(filepath=db_path)
+        mc.get_track_info('T2')
+        assert_equal(mc.session.send.call_count, 3)
+
+        with patch('time.time', return_value=time.time() + mobileclient.GetStoreTrack.cache_ttl):
+            mc.get_track_info('T2')
+        assert_equal(mc.session.send.call_count, 4)
+
+        mc.response_cache.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+@test
+def prefetch_reads_ahead_in_background():
+    retrieved = []
+    first_two_retrieved = threading.Event()
+
+    def pages():
+        for i in range(4):
+            retrieved.append(i)
+            if i == 1:
+                first_two_retrieved.set()
+            yield i
+        raise ValueError('last page')
+
+    prefetched = utils.prefetch(pages(), depth=2)
+    assert_equal(retrieved, [])
+
+    assert_equal(next(prefetched), 0)
+    assert_true(first_two_retrieved.wait(5))
+    assert_equal(list(itertools.islice(prefetched, 3)), [1, 2, 3])
+    assert_raises(ValueError, next, prefetched)
+
+    def interrupted():
+        yield 0
+        raise KeyboardInterrupt
+
+    # the caller isn't left waiting on an exception that's not an Exception
+    assert_raises(KeyboardInterrupt, list, utils.prefetch(interrupted()))
+
+    plain = iter([1])
+    assert_true(utils.prefetch(plain, 0) is plain)
+
+    mc = create_clients().mobileclient
+    mc.prefetch_pages = 1
+    mc._make_call = MagicMock(side_effect=[
+        {'data': {'items': [{'id': 'a'}]}, 'nextPageToken': 't'},
+        {'data': {'items': [{'id': 'b'}]}},
+    ])
+    assert_equal(list(mc.get_all_songs(incremental=True)), [[{'id': 'a'}], [{'id': 'b'}]])
+
+
+@test
+def mc_returns_compact_records():
+    track = {'id': 't1', 'title': 'Haxprocess', 'artist': 'Opeth', 'durationMillis': '418000',
+             'artistId': ['Apoecs6off3y6k4h5nvqqos4b5e'], 'deleted': False,
+             'albumArtRef': [{'url': 'http://lh6.ggpht.com/...'}]}
+
+    record = records.Track(json.loads(json.dumps(track)))
+    other = records.Track(json.loads(json.dumps(track)))
+
+    assert_equal(record.durationMillis, 418000)
+    assert_equal(record['artistId'], ('Apoecs6off3y6k4h5nvqqos4b5e',))
+    assert_true(record['artist'] is other['artist'])
+    assert_equal(record['albumArtRef'], track['albumArtRef'])
+    assert_equal(record.get('rating', '0'), '0')
+    assert_equal(set(record), set(track))
+    assert_false(hasattr(record, '__dict__'))
+    assert_equal(dict(pickle.loads(pickle.dumps(record))), dict(record))
+
+    mc = create_clients().mobileclient
+    mc._make_call = MagicMock(side_effect=lambda call, **kwargs: {
+        mobileclient.ListTracks: {'data': {'items': [track]}},
+        mobileclient.ListPlaylists: {'data': {'items': [{'id': 'p1', 'type': 'USER_GENERATED'}]}},
+        mobileclient.ListPlaylistEntries: {'data': {'items': [
+            {'id': 'e%s' % pos, 'playlistId': 'p1', 'absolutePosition': pos}
+            for pos in ('02', '10', '01')]}},
+    }[call])
+
+    songs = mc.get_all_songs(compact=True)
+    assert_equal([type(s) for s in songs], [records.Track])
+
+    playlists = mc.get_all_user_playlist_contents(compact=True)
+    assert_equal([e['id'] for e in playlists[0]['tracks']], ['e01', 'e02', 'e10'])
+    assert_equal(playlists[0]['tracks'][0].absolutePosition, 1)
+
+
+@test
+def mc_exports_song_columns():
+    if columnar.numpy is None or columnar.pyarrow is None:
+        raise SkipTest('numpy and pyarrow are not installed')
+
+    mc = create_clients().mobileclient
+    mc._make_call = MagicMock(return_value={'data': {'items': [
+        {'id': 'a', 'artist': 'Opeth', 'durationMillis': '418000', 'playCount': 7,
+         'lastModifiedTimestamp': '1330881158830924'},
+        {'id': 'b', 'artist': 'Amorphis', 'rating': '5', 'deleted': False},
+        {'id': 'c', 'artist': 'Opeth', 'durationMillis': 'unknown'},
+    ]}})
+
+    columns = mc.export_songs()
+    assert_equal(columns.categories('artist'), ['Opeth', 'Amorphis'])
+
+    songs, categories = columns.to_numpy()
+    assert_equal(list(songs['durationMillis']), [418000, -1, -1])
+    assert_equal(list(songs['artist']), [0, 1, 0])
+    assert_equal(list(categories['artist'][songs['artist']]), ['Opeth', 'Amorphis', 'Opeth'])
+    assert_equal(str(songs['lastModifiedTimestamp'][0]), '2012-03-04T17:12:38.830924')
+    assert_true(columnar.numpy.isnat(songs['lastModifiedTimestamp'][1]))
+
+    table = columns.to_arrow()
+    assert_equal(table.num_rows, 3)
+    assert_equal(table.column('rating').to_pylist(), [None, 5, None])
+    assert_equal(table.column('artist').to_pylist(), ['Opeth', 'Amorphis', 'Opeth'])
+    assert_equal(table.column('album').null_count, 3)
+
+    buf = io.BytesIO()
+    columns.to_parquet(buf)
+    buf.seek(0)
+    assert_equal(columnar.pyarrow.parquet.read_table(buf).column('id').to_pylist(),
+                 ['a', 'b', 'c'])
+
+    assert_equal(columnar.SongColumns().to_arrow().num_rows, 0)
+
+    with patch.object(columnar, 'pyarrow', None):
+        for export in (columns.to_arrow, partial(columns.to_parquet, io.BytesIO())):
+            assert_raises(ImportError, export)
+
+
+@test
+def mc_groups_playlist_entries_by_playlist():
+    mc = create_clients().mobileclient
+
+    playlists = {'data': {'items': [{'id': 'p%s' % i, 'type': 'USER_GENERATED'}
+                                    for i in range(3)]}}
+    playlists['data']['items'].append({'id': 'shared', 'type': 'SHARED'})
+    entry_pages = [
+        {'data': {'items': [{'id': 'e1', 'playlistId': 'p1', 'absolutePosition': '9'},
+                            {'id': 'e2', 'playlistId': 'p2', 'absolutePosition': '1'}]},
+         'nextPageToken': 'next'},
+        {'data': {'items': [{'id': 'e3', 'playlistId': 'p1', 'absolutePosition': '10'},
+                            {'id': 'e4', 'playlistId': 'p1', 'absolutePosition': '08'},
+                            {'id': 'e5', 'playlistId': 'unknown', 'absolutePosition': '1'}]}},
+    ]
+
+    def make_call(call, **kwargs):
+        if call is mobileclient.ListPlaylists:
+            return copy.deepcopy(playlists)
+        return entry_pages[1 if kwargs['start_token'] else 0]
+
+    mc._make_call = MagicMock(side_effect=make_call)
+
+    contents = mc.get_all_user_playlist_contents()
+    assert_equal([[e['id'] for e in p['tracks']] for p in contents],
+                 [[], ['e4', 'e1', 'e3'], ['e2']])
+
+    contents = mc.get_playlist_contents(['p2', 'p1', 'missing', 'shared', 'p2'])
+    assert_equal([(p['id'], [e['id'] for e in p['tracks']]) for p in contents],
+                 [('p2', ['e2']), ('p1', ['e4', 'e1', 'e3'])])
+
+
+@test
+def static_code_logs_to_calling_client():
+    class LoggingCall:
+        @staticmethod
+        def perform(session, validate):
+            utils.log.debug("in a call")
+
+    class Client(Mobileclient):
+        def log_something(self):
+            utils.log.debug("in a method")
+
+    mc = Client(debug_logging=False)
+    other = Client(debug_logging=False)
+
+    with patch.object(mc.logger, 'debug') as client_debug, \
+            patch.object(other.logger, 'debug') as other_debug:
+        mc._make_call(LoggingCall)
+        mc.log_something()
+        utils.log.debug("outside a client")
+
+    assert_equal([c[0][0] for c in client_debug.call_args_list], ["in a call", "in a method"])
+    assert_false(other_debug.called)
+
+
+@test
+def mc_responses_are_logged_lazily():
+    items = [{'id': str(i)} for i in range(3)]
+    msg = {'kind': 'sj#trackList', 'data': {'items': items}}
+
+    filtered = mobileclient.ListTracks.filter_response(msg)
+    assert_equal(filtered['data']['items'], ['<3 tracks>'])
+    assert_true(msg['data']['items'] is items)
+
+    shared = {'kind': 'sj#playlistEntriesList', 'entries': [{'playlistEntry': items}]}
+    filtered = mobileclient.ListSharedPlaylistEntries.filter_response(shared)
+    assert_equal(filtered['entries'], [{'playlistEntry': ['<3 shared plentries>']}])
+    assert_true(shared['entries'][0]['playlistEntry'] is items)
+
+    # missing fields are left alone
+    assert_equal(mobileclient.ListListenNowItems.filter_response({'kind': 'k'}), {'kind': 'k'})
+
+    mc = create_clients().mobileclient
+    mc.validate = False
+    mc.session.send.return_value = MagicMock(content=json.dumps(msg).encode('utf-8'))
+
+    with patch.object(mobileclient.ListTracks, 'filter_response') as filter_response:
+        mc.logger.setLevel(logging.INFO)
+        mc._make_call(mobileclient.ListTracks)
+        assert_false(filter_response.called)
+
+        mc.logger.setLevel(logging.DEBUG)
+        mc.log_budget = 10
+        mc._make_call(mobileclient.ListTracks)
+        assert_false(filter_response.called)
+
+        mc.log_budget = None
+        mc._make_call(mobileclient.ListTracks)
+        assert_true(filter_response.called)
+
+
 @test
 def no_client_auth_initially():
     # wc = Webclient()
@@ -92,6 +455,266 @@ def mm_prevents_bad_mac_format():
                 uploader_name='valid')
 
 
+@test
+def mm_upload_gathers_track_info_in_worker_processes():
+    paths = [test_mp3_path] * 3
+
+    sequential = list(_map_concurrently(_gather_track_info, paths, 1))
+    concurrent = list(_map_concurrently(_gather_track_info, paths, 2, use_processes=True))
+
+    assert_equal(concurrent, sequential)
+    assert_true(all(track is not None for (path, track, err) in concurrent))
+
+
+@test
+def mm_upload_reports_track_exceptions_as_failures():
+    mm = create_clients().musicmanager
+    mm.uploader_id, mm.uploader_name = '00:11:22:33:AA:BB', 'valid'
+
+    paths = ['good.mp3', 'bad.mp3']
+    upload_states = []
+
+    def make_call(call, *args):
+        if call is musicmanager.UpdateUploadState:
+            upload_states.append(args[0])
+            return
+
+        res = MagicMock()
+        res.metadata_response.signed_challenge_info = []
+        res.metadata_response.track_sample_response = [
+            upload_pb2.TrackSampleResponse(
+                client_track_id=path, server_track_id='s' + path,
+                response_code=upload_pb2.TrackSampleResponse.UPLOAD_REQUESTED)
+            for path in paths]
+        return res
+
+    def upload_track(uploaded, enable_transcoding, transcode_quality, to_upload_item):
+        server_id, (path, track, do_not_rematch) = to_upload_item
+        if path == 'bad.mp3':
+            raise requests.ConnectionError('connection reset')
+
+        uploaded[path] = server_id
+        return path, None
+
+    mm._make_call = make_call
+    mm._upload_track = upload_track
+
+    with patch.object(musicmanager.UploadMetadata, 'fill_track_info',
+                      side_effect=lambda path: locker_pb2.Track(client_id=path)), \
+            patch.object(mm.logger, 'exception'):
+        uploaded, matched, not_uploaded = mm.upload(paths, concurrent_uploads=2)
+
+        assert_equal(uploaded, {'good.mp3': 'sgood.mp3'})
+        assert_equal(list(not_uploaded), ['bad.mp3'])
+        assert_true('connection reset' in not_uploaded['bad.mp3'])
+        assert_equal(upload_states, ['start', 'stopped'])
+
+        # uploads are stopped even when the batch is interrupted
+        mm._upload_track = MagicMock(side_effect=KeyboardInterrupt)
+        upload_states = []
+        assert_raises(KeyboardInterrupt, mm.upload, paths)
+        assert_equal(upload_states, ['start', 'stopped'])
+
+
+@test
+def mm_upload_uses_track_info_cache():
+    mm = create_clients().musicmanager
+    mm.uploader_id, mm.uploader_name = '00:11:22:33:AA:BB', 'valid'
+    mm.track_info_cache = TrackInfoCache(':memory:')
+
+    class Uploading(Exception):
+        pass
+
+    # stop once local info is gathered
+    mm._make_call = MagicMock(side_effect=Uploading)
+    fill_track_info = musicmanager.UploadMetadata.fill_track_info
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'song.mp3')
+        shutil.copy(test_mp3_path, path)
+
+        def uploaded_track():
+            with patch.object(musicmanager.UploadMetadata, 'fill_track_info',
+                              side_effect=fill_track_info) as mock_fill:
+                assert_raises(Uploading, mm.upload, path)
+
+            return mm._make_call.call_args[0][1][0], mock_fill.called
+
+        track, gathered = uploaded_track()
+        assert_true(gathered)
+
+        assert_equal(uploaded_track(), (track, False))
+
+        # a change invalidates the entry
+        os.utime(path, ns=(0, 0))
+        track, gathered = uploaded_track()
+        assert_true(gathered)
+        assert_equal(track.last_modified_timestamp, 0)
+
+
+@test
+def mm_clientid_without_copy_matches_mutagen():
+    UploadMetadata = musicmanager.UploadMetadata
+
+    def add_id3(path, v2_version=4, v1=0, picture=False):
+        tags = ID3()
+        tags.add(TIT2(encoding=3, text='title'))
+        if picture:
+            tags.add(APIC(encoding=3, mime='image/png', type=3, desc='', data=b'x' * 5000))
+        tags.save(path, v2_version=v2_version, v1=v1)
+
+    def add_ape(path):
+        tags = APEv2()
+        tags['title'] = 'title'
+        tags.save(path)
+
+    variants = [
+        [],
+        [add_id3],
+        [partial(add_id3, v2_version=3, picture=True)],
+        [partial(add_id3, v1=2)],
+        [add_ape],
+        [add_id3, add_ape],
+    ]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for i, taggers in enumerate(variants):
+            path = os.path.join(tmpdir, '%s.mp3' % i)
+            shutil.copy(test_mp3_path, path)
+            ID3(path).delete()
+            for tagger in taggers:
+                tagger(path)
+
+            fast = UploadMetadata._md5_stripped_mp3(path)
+            assert_is_not(fast, None)
+            assert_equal(fast.digest(), UploadMetadata._md5_stripped_copy(path).digest(),
+                         "variant %s" % i)
+
+
+@test
+def mm_download_song_resumes():
+    mm = create_clients().musicmanager
+    audio = bytes(range(256)) * 4
+    disposition = "attachment; filename*=UTF-8''song.mp3"
+
+    class FakeDownload:
+        def __init__(self, range_start, drop_after=None):
+            start = range_start or 0
+            self.body = audio[start:drop_after]
+            self.drop = drop_after is not None
+            self.status_code = 200 if range_start is None else 206
+            self.headers = CaseInsensitiveDict({'Content-Disposition': disposition,
+                                                'Content-Length': str(len(audio) - start)})
+            if range_start is not None:
+                self.headers['Content-Range'] = 'bytes %s-%s/%s' % (
+                    start, len(audio) - 1, len(audio))
+
+        def iter_content(self, chunk_size):
+            yield self.body
+            if self.drop:
+                raise requests.ConnectionError('dropped')
+
+        def close(self):
+            pass
+
+    def make_call(protocol, *args):
+        if protocol is musicmanager.GetDownloadLink:
+            return {'url': 'http://example.com/track'}
+
+        range_start = args[1]
+        range_starts.append(range_start)
+        drop = range_start is None or always_drop
+        download = FakeDownload(None if ignore_range else range_start,
+                                drop_after=300 if drop else None)
+        if not sized:
+            del download.headers['Content-Length']
+        return download
+
+    mm._make_call = make_call
+    always_drop = ignore_range = False
+
+    # a dropped connection is resumed
+    for sized in (True, False):
+        range_starts = []
+        assert_equal(mm.download_song('id'), ('song.mp3', audio))
+        assert_equal(range_starts, [None, 299])
+
+    # a short read isn't mistaken for the whole song when the size is unknown
+    always_drop = True
+    range_starts = []
+    assert_raises(CallFailure, mm.download_song, 'id', max_retries=2)
+    assert_equal(range_starts, [None, 299, 299])
+    always_drop = False
+    sized = True
+
+    # as is an interrupted download to a path
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dest = os.path.join(tmpdir, 'song.mp3')
+        with open(dest + '.part', 'wb') as f:
+            f.write(audio[:len(audio) - 1])
+
+        range_starts = []
+        assert_equal(mm.download_song('id', dest), ('song.mp3', len(audio)))
+        assert_equal(range_starts, [len(audio) - 2])
+
+        with open(dest, 'rb') as f:
+            assert_equal(f.read(), audio)
+        assert_false(os.path.exists(dest + '.part'))
+
+    def download_to_pipe():
+        """Return what download_song returned (or raised), and what was read from the pipe."""
+
+        read_fd, write_fd = os.pipe()
+        with ThreadPoolExecutor(1) as executor:
+            received = executor.submit(lambda: open(read_fd, 'rb').read())
+
+            with open(write_fd, 'wb') as pipe:
+                try:
+                    result = mm.download_song('id', pipe)
+                except CallFailure as e:
+                    result = e
+
+            return result, received.result()
+
+    # unseekable destinations can be resumed, but not rewound
+    range_starts = []
+    assert_equal(download_to_pipe(), (('song.mp3', len(audio)), audio))
+    assert_equal(range_starts, [None, 299])
+
+    ignore_range = True
+    result, received = download_to_pipe()
+    assert_true(isinstance(result, CallFailure))
+    assert_equal(received, audio[:300])
+
+
+@test
+def mm_download_library_skips_manifest_entries():
+    mm = create_clients().musicmanager
+    mm.get_uploaded_songs = MagicMock(return_value=[{'id': 'a'}, {'id': 'b'}])
+    mm.get_purchased_songs = MagicMock(return_value=[{'id': 'b'}])
+
+    def download_song(song_id, dest):
+        with open(dest, 'wb') as f:
+            f.write(song_id.encode())
+        return ('song.mp3', 1)
+
+    mm.download_song = MagicMock(side_effect=download_song)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        downloaded, not_downloaded = mm.download_library(tmpdir, workers=2)
+
+        assert_equal(not_downloaded, {})
+        assert_equal(sorted(os.path.basename(p) for p in downloaded.values()),
+                     ['song (1).mp3', 'song.mp3'])
+        for song_id, filepath in downloaded.items():
+            with open(filepath, 'rb') as f:
+                assert_equal(f.read(), song_id.encode())
+
+        mm.download_song.reset_mock()
+        assert_equal(mm.download_library(tmpdir), (downloaded, {}))
+        assert_false(mm.download_song.called)
+
+
 # @test
 # def auto_playlists_are_empty():
 #     # this doesn't actually hit the server at the moment.
@@ -168,6 +791,305 @@ def send_without_auth():
         mock_session.closed.called_once_with()
 
 
+@test
+def send_without_auth_reuses_a_cookieless_session():
+    s = gmusicapi.session.Mobileclient()
+    anon = s._anon_rsession
+    anon.request = MagicMock()
+
+    s.send({'fake': 'kwargs'}, authtypes())
+    s.send({'fake': 'kwargs'}, authtypes())
+    assert_equal(anon.request.call_count, 2)
+
+    response = MagicMock()
+    response.info.return_value = email.message_from_string('Set-Cookie: sid=secret\n\n')
+    anon.cookies.extract_cookies(response, urllib.request.Request('https://example.com/'))
+    assert_equal(len(anon.cookies), 0)
+
+
+@test
+def client_connection_options_apply_to_all_sessions():
+    mc = Mobileclient(debug_logging=False, pool_maxsize=32, timeout=(3, 20), max_retries=2)
+
+    def check_adapter(rsession):
+        adapter = rsession.get_adapter('https://mclients.googleapis.com/')
+        assert_equal(adapter._pool_maxsize, 32)
+        assert_equal(adapter.max_retries.total, 2)
+        assert_true(503 in adapter.max_retries.status_forcelist)
+
+    check_adapter(mc.session._rsession)
+    check_adapter(mc.session._anon_rsession)
+    mc.logout()
+    check_adapter(mc.session._rsession)
+
+    mc.session._anon_rsession.request = MagicMock()
+    mc.session.send({'url': 'https://example.com'}, authtypes())
+    mc.session.send({'url': 'https://example.com', 'timeout': 1}, authtypes())
+
+    assert_equal([c[1]['timeout'] for c in mc.session._anon_rsession.request.call_args_list],
+                 [(3, 20), 1])
+
+
+class _EchoHandler(http.server.BaseHTTPRequestHandler):
+    """Responds with the path and auth of each request."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = json.dumps({'path': self.path,
+                           'auth': self.headers.get('Authorization')}).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@test
+def mc_can_be_shared_between_threads():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _EchoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    class Echo(mobileclient.McCall):
+        static_method = 'GET'
+        static_url = 'http://127.0.0.1:%s/echo' % server.server_port
+        static_params = {'alt': 'json'}
+
+        @classmethod
+        def parse_response(cls, response):
+            return cls._parse_json(response.content)
+
+    mc = Mobileclient(debug_logging=False, validate=False, pool_maxsize=8)
+    mc.session._authtoken = 'token'
+    mc.session.is_authenticated = True
+
+    try:
+        with ThreadPoolExecutor(8) as executor:
+            responses = list(executor.map(lambda _: mc._make_call(Echo), range(400)))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert_equal({r['auth'] for r in responses}, {'GoogleLogin auth=token'})
+    assert_true(all('tier=fr' in r['path'] for r in responses))
+
+    # sessions add params to each request, not to the call's static params
+    assert_equal(Echo.static_params, {'alt': 'json'})
+
+
+@test
+def async_mc_sends_calls_concurrently():
+    if aio.aiohttp is None:
+        raise SkipTest('aiohttp is not installed')
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _EchoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    class Echo(mobileclient.McCall):
+        static_method = 'GET'
+        static_url = 'http://127.0.0.1:%s/echo' % server.server_port
+        static_params = {'alt': 'json'}
+
+        @staticmethod
+        def dynamic_params(i):
+            return {'i': i}
+
+        @classmethod
+        def parse_response(cls, response):
+            return cls._parse_json(response.content)
+
+    mc = Mobileclient(debug_logging=False, validate=False)
+    mc.session._authtoken = 'token'
+    mc.session.is_authenticated = True
+
+    async def make_calls():
+        async with aio.AsyncMobileclient(mc, limit=8) as amc:
+            return await asyncio.gather(*(amc._make_call(Echo, i) for i in range(200)))
+
+    token_threads = set()
+
+    def access_token():
+        token_threads.add(threading.current_thread())
+        return 'oauth-token'
+
+    try:
+        responses = asyncio.run(make_calls())
+
+        # oauth tokens can need a blocking refresh, so they're retrieved off the event loop
+        mc.session._oauth_tokens = MagicMock(access_token=access_token)
+        mc._authtype = 'oauth'
+        oauth_responses = asyncio.run(make_calls())
+        mc._authtype = None
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert_equal({r['auth'] for r in oauth_responses}, {'Bearer oauth-token'})
+    assert_false(threading.current_thread() in token_threads)
+
+    assert_equal({r['auth'] for r in responses}, {'GoogleLogin auth=token'})
+    assert_true(all('tier=fr' in r['path'] for r in responses))
+    assert_equal([r['path'].count('i=%s&' % i) for (i, r) in enumerate(responses)],
+                 [1] * 200)
+
+    mc.logout()
+
+    try:
+        asyncio.run(make_calls())
+    except NotLoggedIn:
+        pass
+    else:
+        raise AssertionError("NotLoggedIn was not raised")
+
+
+class _TrackPagesHandler(http.server.BaseHTTPRequestHandler):
+    """Responds to list calls with three gzipped pages of tracks, one deleted per page."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        page = int(data.get('start-token', 0))
+
+        msg = {'kind': 'sj#trackList',
+               'data': {'items': [{'id': '%s-%s' % (page, i), 'deleted': i == 1, 'rating': 1.5}
+                                  for i in range(3)]}}
+        if page < 2:
+            msg['nextPageToken'] = str(page + 1)
+
+        body = gzip.compress(json.dumps(msg).encode('utf-8'))
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@test
+def async_mc_uses_library_store_and_response_cache():
+    if aio.aiohttp is None:
+        raise SkipTest('aiohttp is not installed')
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _TrackPagesHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    class LocalTracks(mobileclient.ListTracks):
+        static_url = 'http://127.0.0.1:%s/trackfeed' % server.server_port
+
+    mc = Mobileclient(debug_logging=False, validate=False)
+    mc.session._authtoken = 'token'
+    mc.session.is_authenticated = True
+    mc.library_store = LibraryStore(':memory:')
+    mc.response_cache = ResponseCache()
+
+    async def send(req_kwargs, desired_auth):
+        return MagicMock(content=json.dumps({'nid': req_kwargs['params']['nid']}).encode('utf-8'))
+
+    async def make_calls():
+        async with aio.AsyncMobileclient(mc) as amc:
+            songs = await amc._get_all_items(LocalTracks)
+
+            amc._send = MagicMock(side_effect=send)
+            infos = [await amc.get_track_info(i) for i in ('T1', 'T1', 'T2')]
+
+            return songs, infos, amc._send.call_count
+
+    try:
+        with patch.object(Mobileclient, '_library_store_calls', (LocalTracks,)):
+            songs, infos, send_count = asyncio.run(make_calls())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    expected_ids = ['0-0', '0-2', '1-0', '1-2', '2-0', '2-2']
+    assert_equal([s['id'] for s in songs], expected_ids)
+    assert_equal([s['id'] for s in mc.library_store.get_items('LocalTracks')], expected_ids)
+
+    assert_equal(infos, [{'nid': 'T1'}, {'nid': 'T1'}, {'nid': 'T2'}])
+    assert_equal(send_count, 2)
+
+
+@test
+def mc_iterates_streamed_list_items():
+    if mobileclient.ijson is None:
+        raise SkipTest('ijson is not installed')
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _TrackPagesHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    class LocalTracks(mobileclient.ListTracks):
+        static_url = 'http://127.0.0.1:%s/trackfeed' % server.server_port
+
+    mc = Mobileclient(debug_logging=False, validate=False)
+    mc.session._authtoken = 'token'
+    mc.session.is_authenticated = True
+
+    try:
+        items = mc._iter_all_items(LocalTracks)
+        first = next(items)
+        rest = list(items)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert_equal(first, {'id': '0-0', 'deleted': False, 'rating': 1.5})
+    assert_equal([t['id'] for t in rest], ['0-2', '1-0', '1-2', '2-0', '2-2'])
+    assert_true(LocalTracks.streamed() is LocalTracks.streamed())
+    assert_equal(LocalTracks.streamed().__name__, 'LocalTracks')
+
+
+@test
+def mm_refreshes_expired_token_once_across_threads():
+    expired = [True]
+
+    def refresh(http):
+        time.sleep(.05)
+        expired[0] = False
+
+    creds = MagicMock(access_token='token', token_expiry=None)
+    type(creds).access_token_expired = PropertyMock(side_effect=lambda: expired[0])
+    creds.refresh.side_effect = refresh
+
+    s = gmusicapi.session.Musicmanager()
+    s._oauth_tokens = gmusicapi.session._OAuthTokens(creds)
+    s.is_authenticated = True
+    s._rsession = MagicMock()
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda _: s.send({'url': 'u'}, authtypes(oauth=True)), range(16)))
+
+    assert_equal(creds.refresh.call_count, 1)
+    assert_equal(s._rsession.request.call_count, 16)
+
+
+@test
+def oauth_tokens_refresh_ahead_of_expiry():
+    def refresh(http):
+        creds.access_token = 'new'
+        creds.token_expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+    creds = MagicMock(access_token='old', access_token_expired=False,
+                      token_expiry=datetime.datetime.utcnow() + datetime.timedelta(minutes=1))
+    creds.refresh.side_effect = refresh
+
+    tokens = gmusicapi.session._OAuthTokens(creds)
+
+    # the current token is still used while it's refreshed
+    assert_equal(tokens.access_token(), 'old')
+    tokens._background.join()
+    assert_equal(tokens.access_token(), 'new')
+
+    assert_equal(creds.refresh.call_count, 1)
+    assert_true(creds.refresh.call_args[0][0] is tokens._http)
+
+
 #
 # protocol
 #
@@ -196,10 +1118,146 @@ def mc_url_signing():
     assert_equal(sig, b"gua1gInBdaVo7_dSwF9y0kodua0")
 
 
+@test
+def json_backends_agree():
+    text = '{"kind": "sj#trackList", "data": {"items": [{"title": "caf\u00e9", "n": 1.5}]}}'
+    expected = json.loads(text)
+
+    try:
+        for name in utils.json_backends:
+            try:
+                utils.set_json_backend(name)
+            except ImportError:
+                continue
+
+            assert_equal(Call._parse_json(text.encode('utf-8')), expected, name)
+            assert_equal(Call._parse_json(text), expected, name)
+            assert_raises(ParseException, Call._parse_json, b'{"truncated": ')
+    finally:
+        utils.set_json_backend()
+
+
+@test
+def compiled_validation_matches_validictory():
+    track = {'kind': 'sj#track', 'id': 'abc', 'title': 'caf\u00e9', 'artist': 'a', 'album': 'b',
+             'albumArtist': '', 'composer': '', 'trackNumber': 1, 'discNumber': 1,
+             'durationMillis': '1000', 'albumId': 'Bxyz', 'deleted': False}
+    playlist = {'kind': 'sj#playlist', 'id': 'p', 'name': 'n', 'deleted': False,
+                'shareToken': 't', 'accessControlled': False, 'type': 'USER_GENERATED'}
+
+    invalid = [
+        (mobileclient.sj_track, dict(track, trackNumber='1')),
+        (mobileclient.sj_track, dict(track, title='')),
+        (mobileclient.sj_track, {k: v for (k, v) in track.items() if k != 'title'}),
+        (mobileclient.sj_playlist, dict(playlist, type='SOMETHING_ELSE')),
+        (mobileclient.sj_playlist, dict(playlist, accessControlled='false')),
+    ]
+
+    validation.validate(track, mobileclient.sj_track)
+    validation.validate(playlist, mobileclient.sj_playlist)
+
+    for schema, data in invalid:
+        try:
+            validictory.validate(data, schema)
+        except ValueError as e:
+            expected = str(e)
+        else:
+            raise AssertionError("validictory accepted %r" % data)
+
+        try:
+            validation.validate(data, schema)
+        except ValueError as e:
+            assert_equal(str(e), expected)
+        else:
+            raise AssertionError("compiled schema accepted %r" % data)
+
+
+@test
+def validation_policy_samples_list_items():
+    track = {'kind': 'sj#track', 'title': 't', 'artist': 'a', 'album': 'b', 'albumArtist': '',
+             'composer': '', 'trackNumber': 1, 'discNumber': 1, 'durationMillis': '1000',
+             'albumId': 'Bxyz'}
+    items = [track] * 9 + [dict(track, trackNumber='1')]
+    msg = {'kind': 'sj#trackList', 'data': {'items': items}}
+
+    # plain validation only checks the envelope
+    mobileclient.ListTracks.validate(None, msg)
+    validation.ValidationPolicy().validate(mobileclient.ListTracks, None, msg)
+
+    assert_raises(ValidationException, validation.ValidationPolicy(max_items=None).validate,
+                  mobileclient.ListTracks, None, msg)
+
+    first = validation.ValidationPolicy(max_items=5)
+    assert_equal(first.sample_items(items), items[:5])
+    first.validate(mobileclient.ListTracks, None, msg)  # should not raise
+
+    # the envelope is always validated
+    assert_raises(ValidationException, first.validate,
+                  mobileclient.ListTracks, None, dict(msg, kind=1))
+
+    sampled = validation.ValidationPolicy(max_items=3, random_items=True)
+    assert_equal(len(sampled.sample_items(items)), 3)
+
+    every_third = validation.ValidationPolicy(every=3, max_items=None)
+    for _ in range(7):
+        try:
+            every_third.validate(mobileclient.ListTracks, None, msg)
+        except ValidationException:
+            pass
+
+    # shared playlist entries are small, and always validated
+    entry = {'kind': 'sj#playlistEntry', 'id': 'e', 'absolutePosition': '1', 'trackId': 't',
+             'creationTimestamp': '1', 'lastModifiedTimestamp': '1', 'deleted': False,
+             'source': '2'}
+    shared = {'kind': 'sj#playlistEntriesList',
+              'entries': [{'shareToken': 's', 'responseCode': 'OK', 'playlistEntry': [entry]}]}
+    mobileclient.ListSharedPlaylistEntries.validate(None, shared)
+
+    shared['entries'][0]['playlistEntry'].append(dict(entry, deleted='no'))
+    for validate in (mobileclient.ListSharedPlaylistEntries.validate,
+                     partial(validation.ValidationPolicy().validate,
+                             mobileclient.ListSharedPlaylistEntries)):
+        assert_raises(ValidationException, validate, None, shared)
+
+    assert_equal(every_third.stats,
+                 {'ListTracks': Counter(failed=3, skipped=4)})
+    assert_equal(first.stats['ListTracks'], Counter(validated=1, failed=1))
+
+
 #
 # utils
 #
 
+@test
+def cached_property_fills_once_per_instance():
+    release_slow = threading.Event()
+    fills = Counter()
+
+    class Client:
+        def __init__(self, name):
+            self.name = name
+
+        @utils.cached_property(ttl=60)
+        def value(self):
+            fills[self.name] += 1
+            if self.name == 'slow':
+                release_slow.wait(5)
+            return self.name
+
+    slow, fast = Client('slow'), Client('fast')
+
+    with ThreadPoolExecutor(4) as executor:
+        slow_reads = [executor.submit(lambda: slow.value) for _ in range(3)]
+
+        # a slow fill on one instance doesn't block others
+        assert_equal(executor.submit(lambda: fast.value).result(timeout=2), 'fast')
+
+        release_slow.set()
+        assert_equal([r.result() for r in slow_reads], ['slow'] * 3)
+
+    assert_equal(fills, Counter(slow=1, fast=1))
+
+
 @test
 def retry_failure_propogation():
     @utils.retry(tries=1)
@@ -243,3 +1301,118 @@ def jsarray_parsing():
 @test
 def locate_transcoder():
     utils.locate_mp3_transcoder()  # should not raise
+
+
+# stands in for ffmpeg: writes 5 distinct 1000 byte chunks, then misbehaves according to argv
+_fake_transcoder_script = """
+import sys, time
+for i in range(5):
+    sys.stdout.buffer.write(bytes([i]) * 1000)
+    sys.stdout.buffer.flush()
+if sys.argv[1] == 'fail':
+    sys.stderr.write('bad frame')
+    sys.exit(1)
+if sys.argv[1] == 'hang':
+    time.sleep(60)
+"""
+
+_fake_transcoded = b''.join(bytes([i]) * 1000 for i in range(5))
+
+
+def _fake_transcode_cmd(filepath, quality):
+    return [sys.executable, '-c', _fake_transcoder_script, filepath]
+
+
+@test
+def iter_transcode_streams_and_stops_transcoder():
+    procs = []
+    popen = subprocess.Popen
+
+    def track_popen(*args, **kwargs):
+        procs.append(popen(*args, **kwargs))
+        return procs[-1]
+
+    with patch.object(utils, '_mp3_transcode_cmd', _fake_transcode_cmd), \
+            patch.object(utils.subprocess, 'Popen', track_popen), \
+            patch.object(utils, 'log') as log:
+
+        chunks = list(utils.iter_transcode_to_mp3('ok', chunk_size=512))
+        assert_true(all(len(c) <= 512 for c in chunks))
+        assert_equal(b''.join(chunks), _fake_transcoded)
+
+        failing = utils.iter_transcode_to_mp3('fail', chunk_size=512)
+        assert_equal(next(failing), _fake_transcoded[:512])
+        e = assert_raises(OSError, list, failing)
+        assert_true('bad frame' in str(e))
+        assert_true(log.error.called)
+
+        hanging = utils.iter_transcode_to_mp3('hang', chunk_size=512)
+        next(hanging)
+        start = time.time()
+        hanging.close()
+        assert_true(time.time() - start < 10)
+
+    assert_equal([p.returncode for p in procs[:2]], [0, 1])
+    assert_true(procs[2].returncode is not None)  # killed and reaped
+    assert_true(procs[2].stdout.closed)
+
+
+class _UploadHandler(http.server.BaseHTTPRequestHandler):
+    """Responds to uploads with the md5 and transfer encoding of the body received."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_PUT(self):
+        chunked = self.headers.get('Transfer-Encoding') == 'chunked'
+
+        if chunked:
+            body = b''
+            size = None
+            while size != 0:
+                size = int(self.rfile.readline(), 16)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        else:
+            body = self.rfile.read(int(self.headers['Content-Length']))
+
+        res = json.dumps({'sessionStatus': {'state': 'OPEN'},
+                          'chunked': chunked,
+                          'md5': hashlib.md5(body).hexdigest()}).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(res)))
+        self.end_headers()
+        self.wfile.write(res)
+
+    def log_message(self, *args):
+        pass
+
+
+@test
+def mm_streams_upload_bodies():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _UploadHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:%s/upload' % server.server_port
+
+    mm = Musicmanager(debug_logging=False)
+
+    def upload(audio):
+        return mm._make_call(musicmanager.UploadFile, url, 'audio/mpeg', audio,
+                             required_auth=authtypes())
+
+    try:
+        with patch.object(utils, '_mp3_transcode_cmd', _fake_transcode_cmd):
+            transcoded = upload(utils.iter_transcode_to_mp3('ok', chunk_size=512))
+
+        with open(test_mp3_path, 'rb') as f:
+            from_file = upload(f)
+            f.seek(0)
+            file_md5 = hashlib.md5(f.read()).hexdigest()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert_equal(transcoded, {'sessionStatus': {'state': 'OPEN'}, 'chunked': True,
+                              'md5': hashlib.md5(_fake_transcoded).hexdigest()})
+    assert_equal(from_file, {'sessionStatus': {'state': 'OPEN'}, 'chunked': False,
+                             'md5': file_md5})
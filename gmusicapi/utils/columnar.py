@@ -0,0 +1,187 @@
+"""Columnar exports of library songs, for analysis with NumPy, Arrow or Parquet.
+
+Columns are built in compact typed buffers as pages of songs are retrieved,
+then handed to `NumPy <https://numpy.org>`__ or `pyarrow <https://arrow.apache.org>`__
+(which must be installed separately) without another pass over the songs.
+"""
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class SongColumns:
+    """Typed columns of song fields.
+
+    * ``int_fields`` are 64-bit ints
+    * ``timestamp_fields`` are microseconds since the unix epoch
+    * ``category_fields`` are dictionary-encoded: each distinct value is stored once
+    * ``string_fields`` are strings
+    * ``bool_fields`` are bools
+
+    Fields missing from a song (or that aren't numeric, for numeric fields) are null.
+    """
+
+    int_fields = ('year', 'trackNumber', 'discNumber', 'playCount', 'rating',
+                  'durationMillis', 'estimatedSize', 'beatsPerMinute')
+    timestamp_fields = ('creationTimestamp', 'lastModifiedTimestamp', 'recentTimestamp')
+    category_fields = ('artist', 'album', 'albumArtist', 'genre', 'composer')
+    string_fields = ('id', 'title', 'storeId', 'albumId')
+    bool_fields = ('deleted',)
+
+    def __init__(self):
+        numeric_fields = self.int_fields + self.timestamp_fields
+
+        self.num_rows = 0
+
+        self._ints = {f: array('q') for f in numeric_fields}
+        self._present = {f: bytearray() for f in numeric_fields}  # 1 where not null
+        self._codes = {f: array('i') for f in self.category_fields}  # -1 for null
+        self._categories = {f: {} for f in self.category_fields}  # {value: code}
+        self._strings = {f: [] for f in self.string_fields}
+        self._bools = {f: bytearray() for f in self.bool_fields}
+
+    def extend(self, songs):
+        """Add songs (eg a page from :func:`Mobileclient.get_all_songs`) to the columns."""
+
+        for song in songs:
+            for field, values in self._ints.items():
+                try:
+                    values.append(int(song[field]))
+                    self._present[field].append(1)
+                except (KeyError, TypeError, ValueError):
+                    values.append(0)
+                    self._present[field].append(0)
+
+            for field, codes in self._codes.items():
+                value = song.get(field)
+                if value is None:
+                    codes.append(-1)
+                else:
+                    categories = self._categories[field]
+                    codes.append(categories.setdefault(value, len(categories)))
+
+            for field, values in self._strings.items():
+                values.append(song.get(field))
+
+            for field, values in self._bools.items():
+                values.append(bool(song.get(field, False)))
+
+            self.num_rows += 1
+
+    def categories(self, field):
+        """Return the distinct values of a category field, in code order."""
+        return list(self._categories[field])
+
+    def to_numpy(self):
+        """Return ``(songs, categories)``.
+
+        *songs* is a NumPy structured array with a field for each column:
+
+        * int fields are ``int64``, with ``-1`` for nulls
+        * timestamp fields are ``datetime64[us]``, with ``NaT`` for nulls
+        * category fields are ``int32`` codes, with ``-1`` for nulls
+        * string fields are objects, with ``None`` for nulls
+        * bool fields are ``bool``
+
+        *categories* maps category fields to arrays of their values,
+        so ``categories['artist'][songs['artist']]`` gives the artist of each song
+        (where it isn't null).
+        """
+
+        _require(numpy, 'numpy')
+
+        dtype = ([(f, 'i8') for f in self.int_fields] +
+                 [(f, 'M8[us]') for f in self.timestamp_fields] +
+                 [(f, 'i4') for f in self.category_fields] +
+                 [(f, 'O') for f in self.string_fields] +
+                 [(f, '?') for f in self.bool_fields])
+
+        songs = numpy.empty(self.num_rows, dtype=dtype)
+
+        for field in self.int_fields:
+            songs[field] = numpy.where(self._numpy_mask(field), self._numpy_ints(field), -1)
+
+        for field in self.timestamp_fields:
+            timestamps = self._numpy_ints(field).view('M8[us]')
+            songs[field] = numpy.where(self._numpy_mask(field), timestamps,
+                                       numpy.datetime64('NaT'))
+
+        for field in self.category_fields:
+            songs[field] = numpy.frombuffer(self._codes[field], dtype='i4')
+
+        for field in self.string_fields:
+            songs[field] = self._strings[field]
+
+        for field in self.bool_fields:
+            songs[field] = numpy.frombuffer(self._bools[field], dtype='?')
+
+        categories = {f: numpy.array(self.categories(f), dtype='O')
+                      for f in self.category_fields}
+
+        return songs, categories
+
+    def to_arrow(self):
+        """Return a ``pyarrow.Table`` with a column for each field.
+        Category fields are dictionary-encoded and timestamps are in UTC.
+        Requires numpy and pyarrow."""
+
+        _require(numpy, 'numpy')
+        _require(pyarrow, 'pyarrow')
+
+        columns = {}
+
+        for field in self.int_fields:
+            columns[field] = pyarrow.array(self._numpy_ints(field), type=pyarrow.int64(),
+                                           mask=~self._numpy_mask(field))
+
+        for field in self.timestamp_fields:
+            columns[field] = pyarrow.array(self._numpy_ints(field),
+                                           type=pyarrow.timestamp('us', tz='UTC'),
+                                           mask=~self._numpy_mask(field))
+
+        for field in self.category_fields:
+            codes = numpy.frombuffer(self._codes[field], dtype='i4')
+            columns[field] = pyarrow.DictionaryArray.from_arrays(
+                pyarrow.array(codes, mask=codes < 0),
+                pyarrow.array(self.categories(field), type=pyarrow.string()))
+
+        for field in self.string_fields:
+            columns[field] = pyarrow.array(self._strings[field], type=pyarrow.string())
+
+        for field in self.bool_fields:
+            columns[field] = pyarrow.array(numpy.frombuffer(self._bools[field], dtype='?'))
+
+        return pyarrow.table(columns)
+
+    def to_parquet(self, where, **kwargs):
+        """Write the columns to a Parquet file.
+
+        :param where: a filepath or writable binary file object.
+        kwargs are passed to ``pyarrow.parquet.write_table``.
+        """
+
+        _require(pyarrow, 'pyarrow')
+
+        pyarrow.parquet.write_table(self.to_arrow(), where, **kwargs)
+
+    def _numpy_ints(self, field):
+        return numpy.frombuffer(self._ints[field], dtype='i8')
+
+    def _numpy_mask(self, field):
+        """Return a bool array that's True where field isn't null."""
+        return numpy.frombuffer(self._present[field], dtype='?')
+
+
+def _require(module, name):
+    if module is None:
+        raise ImportError("%s must be installed for this export" % name)
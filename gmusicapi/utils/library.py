@@ -0,0 +1,123 @@
+"""A persistent, incrementally-synced snapshot of a user's library."""
+
+import json
+
+from gmusicapi.utils import utils
+from gmusicapi.utils.sqlitestore import SQLiteStore
+
+log = utils.DynamicClientLogger(__name__)
+
+
+class LibraryStore(SQLiteStore):
+    """Stores library items (eg songs, playlists, stations) in an SQLite database.
+
+    A store remembers the newest ``lastModifiedTimestamp`` it has seen for each kind
+    of item, so a client only needs to fetch what has changed since the last sync.
+    Items reported as deleted are removed from the store.
+
+    A single store can be shared by multiple clients, but should only be used for one account.
+    """
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS items ('
+        ' kind TEXT NOT NULL,'
+        ' id TEXT NOT NULL,'
+        ' data TEXT NOT NULL,'
+        ' PRIMARY KEY (kind, id))',
+        'CREATE TABLE IF NOT EXISTS sync_state ('
+        ' kind TEXT PRIMARY KEY,'
+        ' updated_min INTEGER NOT NULL)',
+    )
+
+    def get_updated_min(self, kind):
+        """Return the server timestamp (in microseconds) of the last sync of *kind*,
+        or ``None`` if it has never been synced."""
+
+        with self._lock:
+            row = self._conn.execute('SELECT updated_min FROM sync_state WHERE kind = ?',
+                                     (kind,)).fetchone()
+
+        return row[0] if row is not None else None
+
+    def sync(self, kind, chunks):
+        """Apply changes to the stored items of *kind*, then record the sync.
+        Return the number of items that were added, changed or removed.
+
+        Changes are applied atomically: if *chunks* raises an exception
+        (eg a failed call), the store is left as it was.
+        Items keep their position when they change; new items are added at the end.
+
+        :param kind: a string naming the kind of item, eg ``'ListTracks'``.
+        :param chunks: an iterable of lists of item dicts, as returned by the server.
+          If this kind has never been synced, these must describe the entire library.
+        """
+
+        # retrieve everything first, so the store isn't locked while waiting on the network
+        chunks = [list(chunk) for chunk in chunks]
+
+        num_changes = 0
+
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT updated_min FROM sync_state WHERE kind = ?',
+                                     (kind,)).fetchone()
+            updated_min = row[0] if row is not None else None
+
+            if updated_min is None:
+                # a full listing; don't keep anything we don't hear about.
+                self._conn.execute('DELETE FROM items WHERE kind = ?', (kind,))
+
+            for chunk in chunks:
+                deletes = []
+                upserts = []
+
+                for item in chunk:
+                    if item.get('deleted', False):
+                        deletes.append((kind, item['id']))
+                    else:
+                        upserts.append((json.dumps(item), kind, item['id']))
+
+                    timestamp = item.get('lastModifiedTimestamp')
+                    if timestamp is not None:
+                        updated_min = max(int(timestamp), updated_min or 0)
+
+                self._conn.executemany('DELETE FROM items WHERE kind = ? AND id = ?', deletes)
+                # update in place rather than replacing, which would move rows to the end
+                self._conn.executemany('UPDATE items SET data = ? WHERE kind = ? AND id = ?',
+                                       upserts)
+                self._conn.executemany('INSERT OR IGNORE INTO items (data, kind, id)'
+                                       ' VALUES (?, ?, ?)', upserts)
+                num_changes += len(deletes) + len(upserts)
+
+            if updated_min is None:
+                # an empty library; everything from now on is new.
+                updated_min = -1
+
+            self._conn.execute('INSERT OR REPLACE INTO sync_state (kind, updated_min)'
+                               ' VALUES (?, ?)', (kind, updated_min))
+
+        log.debug("synced %s changes to %s; updated_min is now %s", num_changes, kind, updated_min)
+
+        return num_changes
+
+    def get_items(self, kind):
+        """Return a list of the stored item dicts of *kind*."""
+
+        with self._lock:
+            rows = self._conn.execute('SELECT data FROM items WHERE kind = ? ORDER BY rowid',
+                                      (kind,)).fetchall()
+
+        return [json.loads(data) for (data,) in rows]
+
+    def clear(self, kind=None):
+        """Forget stored items and sync state, forcing a full sync next time.
+
+        :param kind: (optional) only clear items of this kind.
+        """
+
+        with self._lock, self._conn:
+            if kind is None:
+                self._conn.execute('DELETE FROM items')
+                self._conn.execute('DELETE FROM sync_state')
+            else:
+                self._conn.execute('DELETE FROM items WHERE kind = ?', (kind,))
+                self._conn.execute('DELETE FROM sync_state WHERE kind = ?', (kind,))
@@ -0,0 +1,151 @@
+"""Compact representations of library items.
+
+A song dict from :func:`Mobileclient.get_all_songs` has dozens of keys,
+some holding nested lists and dicts, so large libraries take a lot of memory.
+Records hold commonly used fields in slots instead, with:
+
+* repeated strings (eg artist, album and genre names) interned,
+  so records share a single copy of each
+* numeric strings (eg ``'durationMillis'``) converted to ints
+* all other fields kept as compact json that's only decoded when one is accessed
+
+Records are mappings, so ``song['title']`` and ``song.get('rating')`` work as usual.
+Common fields are also attributes: ``song.title``.
+Mapping access is read-only, but these attributes can be assigned
+(eg ``playlist.tracks`` is set this way).
+Use ``dict(record)`` to get a plain dict.
+"""
+
+from collections.abc import Mapping
+import json
+import sys
+
+from gmusicapi.utils import utils
+
+
+class _Record(Mapping):
+    __slots__ = ('_rest',)
+
+    # concrete classes provide (and add these to __slots__):
+    _fields = ()
+
+    # fields holding numeric strings
+    _int_fields = frozenset()
+
+    # fields holding strings (or lists of strings) that are often repeated
+    _interned_fields = frozenset()
+
+    def __init__(self, item):
+        """
+        :param item: a dict from the server.
+        """
+
+        rest = {}
+
+        for key, value in item.items():
+            if key not in self._field_set:
+                rest[key] = value
+                continue
+
+            if key in self._int_fields and isinstance(value, str):
+                try:
+                    value = int(value)
+                except ValueError:
+                    pass
+            elif key in self._interned_fields:
+                value = _intern(value)
+
+            setattr(self, key, value)
+
+        self._rest = json.dumps(rest, separators=(',', ':')).encode('utf-8') if rest else None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_set = frozenset(cls._fields)
+
+    def _rest_dict(self):
+        if self._rest is None:
+            return {}
+        return utils.json_loads(self._rest)
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+
+        return self._rest_dict()[key]
+
+    def __iter__(self):
+        for key in self._fields:
+            if hasattr(self, key):
+                yield key
+
+        yield from self._rest_dict()
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, dict(self))
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+
+def _intern(value):
+    if isinstance(value, str):
+        return sys.intern(value)
+
+    if isinstance(value, list):
+        return tuple(_intern(v) for v in value)
+
+    return value
+
+
+class Track(_Record):
+    """A song from :func:`Mobileclient.get_all_songs`."""
+
+    _fields = ('id', 'kind', 'title', 'artist', 'composer', 'album', 'albumArtist',
+               'year', 'genre', 'trackNumber', 'discNumber', 'totalTrackCount',
+               'totalDiscCount', 'durationMillis', 'estimatedSize', 'playCount', 'rating',
+               'beatsPerMinute', 'storeId', 'nid', 'albumId', 'artistId', 'trackType',
+               'clientId', 'comment', 'deleted', 'creationTimestamp', 'recentTimestamp',
+               'lastModifiedTimestamp')
+    __slots__ = _fields
+
+    _int_fields = frozenset(['durationMillis', 'estimatedSize', 'rating', 'creationTimestamp',
+                             'recentTimestamp', 'lastModifiedTimestamp'])
+
+    _interned_fields = frozenset(['kind', 'artist', 'composer', 'album', 'albumArtist',
+                                  'genre', 'albumId', 'artistId', 'trackType'])
+
+
+class PlaylistEntry(_Record):
+    """An entry of a playlist from :func:`Mobileclient.get_all_user_playlist_contents`."""
+
+    _fields = ('id', 'kind', 'playlistId', 'trackId', 'absolutePosition', 'source',
+               'clientId', 'deleted', 'creationTimestamp', 'lastModifiedTimestamp')
+    __slots__ = _fields
+
+    _int_fields = frozenset(['absolutePosition', 'creationTimestamp', 'lastModifiedTimestamp'])
+
+    _interned_fields = frozenset(['kind', 'playlistId', 'source'])
+
+
+class Playlist(_Record):
+    """A playlist from :func:`Mobileclient.get_all_playlists`.
+
+    Playlists from :func:`Mobileclient.get_all_user_playlist_contents`
+    have a ``'tracks'`` list of :class:`PlaylistEntry`.
+    """
+
+    _fields = ('id', 'kind', 'name', 'type', 'description', 'ownerName',
+               'ownerProfilePhotoUrl', 'shareToken', 'accessControlled', 'deleted',
+               'creationTimestamp', 'recentTimestamp', 'lastModifiedTimestamp', 'tracks')
+    __slots__ = _fields
+
+    _int_fields = frozenset(['creationTimestamp', 'recentTimestamp', 'lastModifiedTimestamp'])
+
+    _interned_fields = frozenset(['kind', 'type', 'ownerName', 'ownerProfilePhotoUrl'])
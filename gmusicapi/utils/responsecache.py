@@ -0,0 +1,175 @@
+"""A cache of server responses to calls for data that rarely changes."""
+
+from collections import Counter, OrderedDict, defaultdict
+import json
+import threading
+import time
+
+from gmusicapi.utils import utils
+from gmusicapi.utils.sqlitestore import SQLiteStore
+
+log = utils.DynamicClientLogger(__name__)
+
+
+class ResponseCache:
+    """Caches parsed responses to calls that declare a ``cache_ttl``,
+    such as store track, album and artist info.
+
+    The most recently used entries are kept in memory.
+    They can also be persisted to an SQLite database, which is checked when
+    an entry isn't in memory, eg after a restart.
+
+    To use one, set it as a client's ``response_cache``::
+
+        from gmusicapi.utils.responsecache import ResponseCache
+
+        mc.response_cache = ResponseCache(max_entries=10000)
+
+    Cached responses are only valid for the client's account, locale and subscription;
+    clients with different ones shouldn't share a cache.
+    """
+
+    def __init__(self, max_entries=1000, filepath=None, ttl=None):
+        """
+        :param max_entries: the number of responses to keep in memory.
+          The least recently used are dropped first.
+        :param filepath: (optional) location of a database file to persist responses to.
+          It will be created if it does not exist.
+          Expired responses are removed from it when it's opened.
+        :param ttl: (optional) seconds to keep every response for,
+          overriding the ``cache_ttl`` of each call.
+        """
+
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+
+        self.max_entries = max_entries
+        self.filepath = filepath
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {key: (expiry time, serialized response)}
+        self._stats = defaultdict(Counter)
+
+        self._persisted = _PersistedResponses(filepath) if filepath is not None else None
+
+    @property
+    def stats(self):
+        """A dict mapping call names to Counters of ``'hits'`` and ``'misses'``."""
+
+        with self._lock:
+            return {name: counter.copy() for (name, counter) in self._stats.items()}
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+    @staticmethod
+    def make_key(call, scope, req_kwargs):
+        """Return the key of a request.
+
+        :param call: a protocol.shared.Call subclass
+        :param scope: json-serializable client state that also affects the response
+        :param req_kwargs: the result of call.build_request
+        """
+
+        return json.dumps([call.__name__, scope, req_kwargs], sort_keys=True, default=repr)
+
+    def get(self, call, key):
+        """Return the cached response for *key*, or ``None`` if there isn't a fresh one.
+
+        Each call returns a new copy of the response, so callers are free to modify it."""
+
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+            elif self._persisted is not None:
+                entry = self._persisted.get(key, now)
+                if entry is not None:
+                    self._remember(key, entry)
+
+            self._stats[call.__name__]['hits' if entry is not None else 'misses'] += 1
+
+        if entry is None:
+            return None
+
+        return utils.json_loads(entry[1])
+
+    def put(self, call, key, response):
+        """Cache a parsed response to *call* for its ``cache_ttl``."""
+
+        ttl = self.ttl if self.ttl is not None else call.cache_ttl
+        entry = (time.time() + ttl, json.dumps(response))
+
+        with self._lock:
+            self._remember(key, entry)
+
+            if self._persisted is not None:
+                self._persisted.put(key, entry)
+
+    def _remember(self, key, entry):
+        """Keep an entry in memory, evicting the least recently used. Call with the lock held."""
+
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Forget all cached responses."""
+
+        with self._lock:
+            self._entries.clear()
+
+            if self._persisted is not None:
+                self._persisted.clear()
+
+    def close(self):
+        with self._lock:
+            if self._persisted is not None:
+                self._persisted.close()
+
+
+class _PersistedResponses(SQLiteStore):
+    """The on-disk part of a ResponseCache: ``{key: (expiry time, serialized response)}``."""
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS responses ('
+        ' key TEXT PRIMARY KEY,'
+        ' expires REAL NOT NULL,'
+        ' response TEXT NOT NULL)',
+    )
+
+    def __init__(self, filepath):
+        super().__init__(filepath)
+
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM responses WHERE expires <= ?', (time.time(),))
+
+    def get(self, key, now):
+        """Return the entry for key if it's fresh at *now*, otherwise None."""
+
+        with self._lock:
+            row = self._conn.execute('SELECT expires, response FROM responses'
+                                     ' WHERE key = ? AND expires > ?', (key, now)).fetchone()
+
+        return tuple(row) if row is not None else None
+
+    def put(self, key, entry):
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO responses (key, expires, response)'
+                               ' VALUES (?, ?, ?)', (key,) + entry)
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM responses')
@@ -0,0 +1,40 @@
+"""A base for objects that persist data to an SQLite database."""
+
+import os
+import sqlite3
+import threading
+
+from gmusicapi.utils import utils
+
+
+class SQLiteStore:
+    """Factors out opening, locking and closing a database shared between threads.
+
+    Subclasses set ``_schema`` to the statements that create their tables,
+    and hold ``self._lock`` while using ``self._conn``.
+    """
+
+    # concrete classes provide:
+    _schema = ()
+
+    def __init__(self, filepath):
+        """
+        :param filepath: location of the database file.
+          It will be created if it does not exist.
+          ``':memory:'`` can be used for a database that is not persisted.
+        """
+
+        if filepath != ':memory:':
+            utils.make_sure_path_exists(os.path.dirname(os.path.abspath(filepath)))
+
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filepath, check_same_thread=False)
+
+        with self._conn:
+            for statement in self._schema:
+                self._conn.execute(statement)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,78 @@
+"""A persistent cache of upload metadata for local files."""
+
+import os
+
+from gmusicapi.utils import utils
+from gmusicapi.utils.sqlitestore import SQLiteStore
+
+log = utils.DynamicClientLogger(__name__)
+
+
+class TrackInfoCache(SQLiteStore):
+    """Stores the upload metadata (including client id) of local files in an SQLite database.
+
+    Entries are keyed by a file's path, size, modification time and inode,
+    so any change to a file invalidates its entry.
+    """
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS tracks ('
+        ' path TEXT PRIMARY KEY,'
+        ' size INTEGER NOT NULL,'
+        ' mtime_ns INTEGER NOT NULL,'
+        ' inode INTEGER NOT NULL,'
+        ' track BLOB NOT NULL)',
+    )
+
+    @staticmethod
+    def file_key(filepath):
+        """Return a tuple identifying the current contents of the file at *filepath*,
+        or ``None`` if it can't be read.
+
+        Take this before reading a file, so changes made while reading are noticed."""
+
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None
+
+        return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def get(self, filepath, file_key):
+        """Return the cached serialized ``locker_pb2.Track`` for *filepath*,
+        or ``None`` if there isn't one for this *file_key*."""
+
+        if file_key is None:
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT track FROM tracks'
+                ' WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?',
+                (os.path.abspath(filepath),) + file_key).fetchone()
+
+        return row[0] if row is not None else None
+
+    def update(self, entries):
+        """Cache tracks in a single transaction.
+
+        :param entries: an iterable of ``(filepath, file_key, serialized_track)``.
+          Entries without a file key are ignored.
+        """
+
+        rows = [(os.path.abspath(filepath),) + file_key + (track,)
+                for (filepath, file_key, track) in entries
+                if file_key is not None]
+
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO tracks'
+                                   ' (path, size, mtime_ns, inode, track)'
+                                   ' VALUES (?, ?, ?, ?, ?)', rows)
+
+        log.debug("cached track info of %s files", len(rows))
+
+    def clear(self):
+        """Forget all cached tracks."""
+
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM tracks')
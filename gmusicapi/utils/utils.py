@@ -2,17 +2,22 @@
 
 import ast
 from bisect import bisect_left
+import contextlib
+import contextvars
+import datetime
 from distutils import spawn
 import errno
 import functools
-import inspect
+import importlib
 import itertools
 import logging
 import os
+import queue
 import re
 import subprocess
+import tempfile
+import threading
 import time
-import traceback
 import warnings
 
 from decorator import decorator
@@ -22,7 +27,7 @@ from gmusicapi import __version__
 from gmusicapi.appdirs import my_appdirs
 from gmusicapi.exceptions import CallFailure, GmusicapiWarning, NotSubscribed
 
-# this controls the crazy logging setup that checks the callstack;
+# this controls the per-client logging setup (see DynamicClientLogger);
 #  it should be monkey-patched to False after importing to disable it.
 # when False, static code will simply log in the standard way under the root.
 per_client_logging = True
@@ -48,11 +53,81 @@ printed_log_start_message = False  # global, set in config_debug_logging
 #   00:11:22:33:AA:BB
 _mac_pattern = re.compile("^({pair}:){{5}}{pair}$".format(pair='[0-9A-F]' * 2))
 
+# modules that can parse json responses.
+# all of these accept bytes and raise ValueError on bad input.
+json_backends = ('orjson', 'rapidjson', 'ujson', 'json')
+
+# in order of preference.
+# rapidjson and ujson aren't used by default since they aren't faster
+# than json on recent Pythons; see test/benchmark_json.py.
+_default_json_backends = ('orjson', 'json')
+
+# set by set_json_backend
+json_backend = None
+json_loads = None
+
+
+def set_json_backend(name=None):
+    """Choose the module used to parse json responses. Return its name.
+
+    :param name: (optional) one of :data:`json_backends`.
+      By default, orjson is used if it's installed, falling back to json.
+
+    Raise ImportError if *name* is not installed.
+    """
+
+    global json_backend, json_loads
+
+    for candidate in (_default_json_backends if name is None else (name,)):
+        if candidate not in json_backends:
+            raise ValueError("unknown json backend %r; choose from %s" % (candidate, json_backends))
+
+        try:
+            module = importlib.import_module(candidate)
+        except ImportError:
+            if name is not None:
+                raise
+            continue
+
+        json_backend, json_loads = candidate, module.loads
+        return candidate
+
+
+set_json_backend()
+
+
+# the logger and log budget of the client whose code is running; see DynamicClientLogger.
+_client_logger = contextvars.ContextVar('gmusicapi_client_logger', default=None)
+_client_log_budget = contextvars.ContextVar('gmusicapi_client_log_budget', default=None)
+
+
+@contextlib.contextmanager
+def client_logging(logger, log_budget=None):
+    """Send DynamicClientLogger output to *logger* within this context.
+
+    :param log_budget: see log_budget()
+    """
+
+    logger_token = _client_logger.set(logger)
+    budget_token = _client_log_budget.set(log_budget)
+    try:
+        yield
+    finally:
+        _client_log_budget.reset(budget_token)
+        _client_logger.reset(logger_token)
+
+
+def log_budget():
+    """Return the size in bytes of the largest response the running client logs,
+    or None if there is no limit."""
+
+    return _client_log_budget.get()
+
 
 class DynamicClientLogger:
-    """Dynamically proxies to the logger of a Client higher in the call stack.
+    """Dynamically proxies to the logger of the Client whose code is running.
 
-    This is a ridiculous hack needed because
+    This is needed because
     logging is, in the eyes of a user, per-client.
 
     So, logging from static code (eg protocol, utils) needs to log using the
@@ -61,11 +136,11 @@ class DynamicClientLogger:
     There can be multiple clients, so we can't just use a globally-available
     logger.
 
-    Instead of refactoring every function to receieve a logger, we introspect
-    the callstack at runtime to figure out who's calling us, then use their
-    logger.
-
-    This probably won't work on non-CPython implementations.
+    Instead of refactoring every function to receieve a logger, clients
+    set their logger in a context variable (see client_logging)
+    when making calls and running public methods.
+    Code running outside of a client (eg in upload worker threads)
+    logs to the logger named *caller_name*.
     """
 
     def __init__(self, caller_name):
@@ -75,33 +150,10 @@ class DynamicClientLogger:
         # this isn't a totally foolproof way to proxy, but it's fine for
         # the usual logger.debug, etc methods.
 
-        logger = logging.getLogger(self.caller_name)
-
-        if per_client_logging:
-            # search upwards for a client instance
-            for frame_rec in inspect.getouterframes(inspect.currentframe()):
-                frame = frame_rec[0]
-
-                try:
-                    if 'self' in frame.f_locals:
-                        f_self = frame.f_locals['self']
-
-                        # can't import and check against classes; that causes an import cycle
-                        if (f_self is not None and
-                            f_self.__module__.startswith('gmusicapi.clients') and
-                            f_self.__class__.__name__ in ('Musicmanager', 'Webclient',
-                                                          'Mobileclient')):
-                            logger = f_self.logger
-                            break
-                finally:
-                    del frame  # avoid circular references
-
-            else:
-                # log to root logger.
-                # should this be stronger? There's no default root logger set up.
-                stack = traceback.extract_stack()
-                logger.info('could not locate client caller in stack:\n%s',
-                            '\n'.join(traceback.format_list(stack)))
+        logger = _client_logger.get() if per_client_logging else None
+
+        if logger is None:
+            logger = logging.getLogger(self.caller_name)
 
         return getattr(logger, name)
 
@@ -185,6 +237,18 @@ def datetime_to_microseconds(dt):
     return int(time.mktime(dt.timetuple()) * 1000000) + dt.microsecond
 
 
+def microseconds_to_datetime(microseconds):
+    """Return a naive local datetime.datetime; the inverse of datetime_to_microseconds.
+
+    :param microseconds: microseconds since epoch, as an int or numeric string
+      (eg a server ``lastModifiedTimestamp``).
+    """
+    microseconds = int(microseconds)
+    dt = datetime.datetime.fromtimestamp(microseconds // 1000000)
+
+    return dt.replace(microsecond=microseconds % 1000000)
+
+
 def is_valid_mac(mac_string):
     """Return True if mac_string is of form
     eg '00:11:22:33:AA:BB'.
@@ -469,24 +533,7 @@ def transcode_to_mp3(filepath, quality='320k', slice_start=None, slice_duration=
     """
 
     err_output = None
-    cmd_path = locate_mp3_transcoder()
-    cmd = [cmd_path, '-i', filepath]
-
-    if slice_duration is not None:
-        cmd.extend(['-t', str(slice_duration)])
-    if slice_start is not None:
-        cmd.extend(['-ss', str(slice_start)])
-
-    if isinstance(quality, int):
-        cmd.extend(['-q:a', str(quality)])
-    elif isinstance(quality, str):
-        cmd.extend(['-b:a', quality])
-    else:
-        raise ValueError("quality must be int or string, but received %r" % quality)
-
-    cmd.extend(['-f', 's16le',  # don't output id3 headers
-                '-c', 'libmp3lame',
-                'pipe:1'])
+    cmd = _mp3_transcode_cmd(filepath, quality, slice_start, slice_duration)
 
     log.debug('running transcode command %r', cmd)
 
@@ -518,6 +565,164 @@ def transcode_to_mp3(filepath, quality='320k', slice_start=None, slice_duration=
         return audio_out
 
 
+def iter_transcode_to_mp3(filepath, quality='320k', chunk_size=64 * 1024):
+    """Return a generator of the mp3 result of transcoding the file at *filepath*,
+    in bytestrings of at most *chunk_size*.
+    Unlike :func:`transcode_to_mp3`, the whole result is never held in memory.
+    Closing the generator early stops the transcoder.
+
+    The transcoder is started before this returns, and the first chunk is read,
+    so that problems like a missing transcoder or unreadable file are raised immediately.
+    See :func:`transcode_to_mp3` for the other params.
+
+    Raise:
+      * OSError: problems during transcoding.
+        These can also be raised while iterating.
+      * ValueError: invalid params, transcoder not found
+    """
+
+    cmd = _mp3_transcode_cmd(filepath, quality)
+
+    log.debug('running streaming transcode command %r', cmd)
+
+    # stderr goes to a file, since a full stderr pipe would block the transcoder.
+    err_file = tempfile.TemporaryFile()
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err_file)
+    except OSError as e:
+        err_file.close()
+        err_msg = "transcoding command (%r) failed: %s. " % (' '.join(cmd), e)
+        log.exception('transcoding failure:\n%s', err_msg)
+        raise OSError(err_msg)
+
+    def read_chunks():
+        try:
+            while True:
+                chunk = proc.stdout.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+            proc.stdout.close()
+            if proc.wait() != 0:
+                err_file.seek(0)
+                err_output = err_file.read().decode('ascii', 'replace')
+                err_msg = ("transcoding command (%r) failed (return code: %r)."
+                           "\nstderr: '%s'" % (' '.join(cmd), proc.returncode, err_output))
+
+                log.error('transcoding failure:\n%s', err_msg)
+                raise OSError(err_msg)
+        finally:
+            if proc.poll() is None:
+                # we were closed early
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+            err_file.close()
+
+    def with_first(chunks, first):
+        # unlike itertools.chain, closing this closes chunks (killing the transcoder)
+        with contextlib.closing(chunks):
+            if first:
+                yield first
+            yield from chunks
+
+    chunks = read_chunks()
+
+    return with_first(chunks, next(chunks, b''))
+
+
+def _mp3_transcode_cmd(filepath, quality, slice_start=None, slice_duration=None):
+    """Return the transcoder command list; see transcode_to_mp3 for params."""
+
+    cmd_path = locate_mp3_transcoder()
+    cmd = [cmd_path, '-i', filepath]
+
+    if slice_duration is not None:
+        cmd.extend(['-t', str(slice_duration)])
+    if slice_start is not None:
+        cmd.extend(['-ss', str(slice_start)])
+
+    if isinstance(quality, int):
+        cmd.extend(['-q:a', str(quality)])
+    elif isinstance(quality, str):
+        cmd.extend(['-b:a', quality])
+    else:
+        raise ValueError("quality must be int or string, but received %r" % quality)
+
+    cmd.extend(['-f', 's16le',  # don't output id3 headers
+                '-c', 'libmp3lame',
+                'pipe:1'])
+
+    return cmd
+
+
+def prefetch(iterable, depth=1):
+    """Return an iterator over *iterable* that retrieves items in a background thread,
+    keeping up to *depth* items ready ahead of the caller.
+
+    This lets the caller process an item (eg a page of a library listing)
+    while the next is retrieved. Exceptions raised by *iterable* are raised to the caller.
+
+    :param depth: the number of items to retrieve ahead.
+      If 0, *iterable* is returned as-is.
+    """
+
+    if depth < 1:
+        return iterable
+
+    return _prefetch(iterable, depth)
+
+
+def _prefetch(iterable, depth):
+    items = queue.Queue(depth)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        """Queue item unless the caller stops iterating first. Return False if it did."""
+
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def produce():
+        error = None
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            # eg KeyboardInterrupt; the caller raises it
+            error = e
+        finally:
+            # always release the caller, however iteration ended
+            put((done, error))
+
+    # the context carries the client logger to the thread
+    producer = threading.Thread(target=contextvars.copy_context().run, args=(produce,),
+                                name='gmusicapi-prefetch', daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            item, error = items.get()
+
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+
+            yield item
+    finally:
+        stopped.set()
+
+
 def truncate(x, max_els=100, recurse_levels=0):
     """Return a 'shorter' truncated x of the same type, useful for logging.
     recurse_levels is only valid for homogeneous lists/tuples.
@@ -644,14 +849,18 @@ class cached_property:
         return self
 
     def __get__(self, inst, owner):
-        now = time.time()
-
         try:
-            value, last_update = inst._cache[self.__name__]
-
-            if (self.ttl > 0) and (now - last_update > self.ttl):
-                raise AttributeError
+            return self._get_cached(inst)
         except (KeyError, AttributeError):
+            pass
+
+        with self._lock(inst):
+            try:
+                return self._get_cached(inst)
+            except (KeyError, AttributeError):
+                pass
+
+            now = time.time()
             value = self.fget(inst)
 
             try:
@@ -663,6 +872,24 @@ class cached_property:
 
         return value
 
+    def _lock(self, inst):
+        """Return the lock that makes threads sharing *inst* only compute the value once.
+
+        Each instance has its own, so a slow fill doesn't block other instances."""
+
+        # dict.setdefault is atomic, so concurrent callers get the same lock
+        locks = inst.__dict__.setdefault('_cached_property_locks', {})
+        return locks.setdefault(self.__name__, threading.RLock())
+
+    def _get_cached(self, inst):
+        """Return the cached value, raising KeyError or AttributeError if there isn't a fresh one."""
+        value, last_update = inst._cache[self.__name__]
+
+        if (self.ttl > 0) and (time.time() - last_update > self.ttl):
+            raise AttributeError
+
+        return value
+
     def __set__(self, inst, value):
         raise AttributeError("Can't set cached properties")
 
@@ -0,0 +1,322 @@
+"""Fast validation of responses against validictory schemas.
+
+Walking a schema with validictory is slow for large responses (eg thousands of tracks).
+Instead, each schema is compiled once into nested closures that only check validity.
+validictory is only run when data is invalid, so error messages are unchanged.
+
+Only the subset of validictory used by our schemas is compiled.
+Schemas that use anything else are always checked with validictory.
+
+A ValidationPolicy can be used in place of ``validate=True`` to validate less,
+or to also validate the items of list responses.
+"""
+
+from collections import Counter, defaultdict
+from collections.abc import Mapping
+import random
+import re
+import threading
+
+import validictory
+
+from gmusicapi.utils import utils
+
+log = utils.DynamicClientLogger(__name__)
+
+# validictory's defaults
+_required_by_default = True
+_blank_by_default = False
+
+_type_checkers = {
+    'string': lambda v: isinstance(v, str),
+    'integer': lambda v: type(v) is int,
+    'number': lambda v: type(v) in (int, float),
+    'boolean': lambda v: type(v) is bool,
+    'object': lambda v: isinstance(v, Mapping) or (hasattr(v, 'keys') and hasattr(v, 'items')),
+    'array': lambda v: isinstance(v, (list, tuple)),
+    'null': lambda v: v is None,
+    'any': lambda v: True,
+}
+
+# schema keywords that are compiled.
+# validictory ignores keywords it has no validator for, so we do too.
+_compiled_keywords = {'type', 'properties', 'items', 'required', 'blank', 'pattern',
+                      'additionalProperties', 'title', 'description'}
+
+# {id(schema): (schema, check or None)}; schema is kept to pin its id.
+_compiled = {}
+_compile_lock = threading.Lock()
+
+
+class _Uncompilable(Exception):
+    pass
+
+
+def validate(data, schema):
+    """Like ``validictory.validate(data, schema)``: raise ValueError if *data* is invalid."""
+
+    check = _get_check(schema)
+
+    if check is not None and check(True, data):
+        return
+
+    # either the schema can't be compiled or the data is invalid.
+    # let validictory find (and explain) any problem.
+    validictory.validate(data, schema)
+
+    if check is not None:
+        log.debug("compiled schema rejected data that validictory accepted")
+
+
+def _get_check(schema):
+    """Return the compiled check for *schema*, or None if it can't be compiled."""
+
+    try:
+        return _compiled[id(schema)][1]
+    except KeyError:
+        pass
+
+    with _compile_lock:
+        if id(schema) not in _compiled:
+            try:
+                check = _compile(schema, {})
+            except _Uncompilable as e:
+                log.debug("using validictory for schema: %s", e)
+                check = None
+
+            _compiled[id(schema)] = (schema, check)
+
+    return _compiled[id(schema)][1]
+
+
+def _compile(schema, memo):
+    """Return a function check(present, value) -> bool for *schema*.
+
+    *present* is False when the field being checked is missing.
+
+    :param memo: {id(schema): check} of schemas being compiled, for recursive schemas.
+    """
+
+    if id(schema) in memo:
+        return memo[id(schema)]
+
+    if not isinstance(schema, dict):
+        raise _Uncompilable("schema is not a dict: %r" % schema)
+
+    for keyword in schema:
+        if keyword not in _compiled_keywords and hasattr(validictory.SchemaValidator,
+                                                         'validate_' + keyword):
+            raise _Uncompilable("keyword %r" % keyword)
+
+    # recursive references to this schema go through a cell that's filled in below.
+    cell = []
+    memo[id(schema)] = lambda present, value: cell[0](present, value)
+
+    required = schema.get('required', _required_by_default)
+    blank = schema.get('blank', _blank_by_default)
+    checks = []  # each check(value) -> bool, run when the field is present
+
+    if not blank:
+        checks.append(lambda v: not (isinstance(v, str) and not v))
+
+    if 'type' in schema:
+        checks.append(_compile_type(schema['type'], memo))
+
+    if 'pattern' in schema:
+        pattern = schema['pattern']
+        regex = re.compile(pattern) if isinstance(pattern, str) else pattern
+        checks.append(lambda v: not isinstance(v, str) or regex.match(v) is not None)
+
+    if 'properties' in schema:
+        properties = schema['properties']
+        if not isinstance(properties, dict):
+            raise _Uncompilable("properties is not a dict")
+
+        prop_checks = [(name, _compile(sub, memo)) for (name, sub) in properties.items()]
+
+        def check_properties(v):
+            if not isinstance(v, dict):
+                return True
+
+            for name, check in prop_checks:
+                if name in v:
+                    if not check(True, v[name]):
+                        return False
+                elif not check(False, None):
+                    return False
+            return True
+
+        checks.append(check_properties)
+
+    if 'items' in schema:
+        items = schema['items']
+        if isinstance(items, dict):
+            item_check = _compile(items, memo)
+
+            def check_items(v):
+                if not isinstance(v, (list, tuple)):
+                    return True
+                return all(item_check(True, item) for item in v)
+        elif isinstance(items, (list, tuple)):
+            raise _Uncompilable("tuple items")
+        else:
+            # validictory raises SchemaError when applied to a list
+            def check_items(v):
+                return not isinstance(v, (list, tuple))
+
+        checks.append(check_items)
+
+    if 'additionalProperties' in schema:
+        additional = schema['additionalProperties']
+        known = set(schema.get('properties') or {})
+
+        if additional is True:
+            pass
+        elif additional is False:
+            checks.append(lambda v: not isinstance(v, dict) or known.issuperset(v))
+        elif isinstance(additional, dict):
+            additional_check = _compile(additional, memo)
+
+            def check_additional(v):
+                if not isinstance(v, dict):
+                    return True
+                return all(additional_check(True, v[k]) for k in v if k not in known)
+
+            checks.append(check_additional)
+        else:
+            raise _Uncompilable("additionalProperties is not a bool or dict")
+
+    for keyword in ('title', 'description'):
+        if not isinstance(schema.get(keyword), (str, type(None))):
+            raise _Uncompilable("%s is not a string" % keyword)
+
+    if not checks:
+        def check(present, value):
+            return present or not required
+    elif len(checks) == 1:
+        only_check = checks[0]
+
+        def check(present, value):
+            if not present:
+                return not required
+            return only_check(value)
+    else:
+        def check(present, value):
+            if not present:
+                return not required
+            for c in checks:
+                if not c(value):
+                    return False
+            return True
+
+    cell.append(check)
+    memo[id(schema)] = check
+
+    return check
+
+
+def _compile_type(fieldtype, memo):
+    """Return check(value) -> bool for the value of a schema's type keyword."""
+
+    if isinstance(fieldtype, str):
+        try:
+            return _type_checkers[fieldtype]
+        except KeyError:
+            raise _Uncompilable("type %r" % fieldtype) from None
+
+    if isinstance(fieldtype, dict):
+        sub_check = _compile(fieldtype, memo)
+        return lambda v: sub_check(True, v)
+
+    if isinstance(fieldtype, (list, tuple)):
+        type_checks = [_compile_type(t, memo) for t in fieldtype]
+        return lambda v: any(c(v) for c in type_checks)
+
+    raise _Uncompilable("type %r" % fieldtype)
+
+
+class ValidationPolicy:
+    """Decides how much of each server response is validated.
+
+    Pass one as ``validate`` when creating a client, or assign it to ``client.validate``.
+    ``validate=True`` is equivalent to ``ValidationPolicy()``, but keeps no stats.
+
+    For example, to validate the first call of each kind and one in 100 after that,
+    checking 50 random items of large lists::
+
+        ValidationPolicy(every=100, max_items=50, random_items=True)
+    """
+
+    def __init__(self, every=1, max_items=0, random_items=False):
+        """
+        :param every: validate one in this many responses of each call.
+          The first response of each call is always validated.
+        :param max_items: validate at most this many items of list responses
+          (eg :func:`Mobileclient.get_all_songs` pages); ``None`` validates all of them.
+          By default only the rest of the response is validated, like ``validate=True``.
+        :param random_items: if ``True``, validate a random sample of items
+          rather than the first *max_items*.
+        """
+
+        if every < 1:
+            raise ValueError("every must be at least 1")
+        if max_items is not None and max_items < 0:
+            raise ValueError("max_items must not be negative")
+
+        self.every = every
+        self.max_items = max_items
+        self.random_items = random_items
+
+        self._lock = threading.Lock()
+        self._seen = Counter()
+        self._stats = defaultdict(Counter)
+
+    @property
+    def stats(self):
+        """A dict mapping call names to Counters of
+        ``'validated'``, ``'skipped'`` and ``'failed'`` responses."""
+
+        with self._lock:
+            return {name: counter.copy() for (name, counter) in self._stats.items()}
+
+    def reset_stats(self):
+        with self._lock:
+            self._seen.clear()
+            self._stats.clear()
+
+    def sample_items(self, items):
+        """Return the items of a list response that should be validated."""
+
+        if self.max_items is None or len(items) <= self.max_items:
+            return items
+
+        if self.random_items:
+            return random.sample(items, self.max_items)
+
+        return items[:self.max_items]
+
+    def validate(self, call, response, msg):
+        """Validate a response to *call* according to this policy.
+
+        :param call: a protocol.shared.Call subclass
+        :param response: a requests.Response
+        :param msg: the result of call.parse_response on response
+        """
+
+        name = call.__name__
+
+        with self._lock:
+            seen = self._seen[name]
+            self._seen[name] += 1
+
+            if seen % self.every:
+                self._stats[name]['skipped'] += 1
+                return
+
+        outcome = 'failed'
+        try:
+            call.validate_sample(response, msg, self)
+            outcome = 'validated'
+        finally:
+            with self._lock:
+                self._stats[name][outcome] += 1
@@ -51,6 +51,11 @@ setup(
         'gpsoauth >= 0.2.0',                      # mac -> android_id, validation, pycryptodome
         'MechanicalSoup >= 0.4.0',
     ],
+    extras_require={
+        'async': ['aiohttp >= 3.0'],              # ClientTimeout
+        'stream': ['ijson >= 3.1'],               # use_float
+        'columnar': ['numpy', 'pyarrow'],
+    },
     classifiers=[
         'Development Status :: 4 - Beta',
         'Intended Audience :: Developers',